@@ -0,0 +1,197 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.synthetic_gpx import generate_archive
+from db_handling import DBHandling
+from file_handling import GPXFileHandling
+from instrumentation import metrics
+
+"""
+Benchmarks of the import, the DB queries and the map rendering on a synthetic archive. Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --files 500 --points 2000 --output results.json
+
+The results are written as JSON so that runs can be compared with each other.
+"""
+
+TRACK_MAP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'track-map.py')
+
+
+def percentiles(values: [float]) -> dict:
+    """
+    Returns nearest rank percentiles of latencies given in seconds, in milliseconds
+    """
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] * 1000
+
+    return {'count': len(ordered), 'p50_ms': rank(50), 'p90_ms': rank(90), 'p99_ms': rank(99),
+            'max_ms': ordered[-1] * 1000, 'mean_ms': sum(ordered) / len(ordered) * 1000}
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    """
+    Peak resident set size so far, ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measured(function, *args) -> dict:
+    """
+    Run a benchmark scenario and add the peak memory use of this process and of the largest process it started, e.g.
+    a GPX parsing worker or a create_map run
+    """
+    result = function(*args)
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['children_peak_rss_mb'] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    return result
+
+
+def run_isolated(function, *args) -> dict:
+    """
+    Run a benchmark scenario in a new process. The peak RSS of a process never decreases and the children peak
+    covers every child ever waited for, so measured in one process all scenarios would report the same peak.
+    A spawned process does not start with the memory of this one as a forked process would.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(measured, function, *args).result()
+
+
+def bench_ingest(archive_dir: str, db_file: str, storage: str, workers: int, batch_size: int) -> dict:
+    dbh = DBHandling(db_file, storage)
+    dbh.set_import_pragmas()
+    dbh.create_gpx_table()
+    metrics.reset()
+    started = time.perf_counter()
+    GPXFileHandling().store_track_files_to_db(archive_dir + '/', dbh, batch_size, workers)
+    elapsed = time.perf_counter() - started
+    files, points = dbh.connection.execute("SELECT COUNT(*), SUM(point_count) FROM tracks").fetchone()
+    dbh.close_connection()
+    return {'storage': storage, 'workers': workers, 'seconds': elapsed, 'files': files, 'points': points,
+            'files_per_s': files / elapsed, 'points_per_s': points / elapsed,
+            'db_size_mb': os.path.getsize(db_file) / (1024 * 1024), 'phases': metrics.summary()['phases']}
+
+
+def random_windows(rng: random.Random, activities: [str], start_date: str, days: int, window_days: int,
+                   queries: int) -> list[tuple]:
+    first_day = time.mktime(time.strptime(start_date, '%Y-%m-%d'))
+    windows = []
+    for _ in range(queries):
+        start = first_day + rng.randrange(max(1, days - window_days)) * 86400
+        windows.append((time.strftime('%Y-%m-%d', time.localtime(start)),
+                        time.strftime('%Y-%m-%d', time.localtime(start + (window_days - 1) * 86400)),
+                        rng.choice(activities)))
+    return windows
+
+
+def bench_queries(db_file: str, windows: list[tuple]) -> dict:
+    dbh = DBHandling(db_file)
+    tracks_latencies = []
+    points_latencies = []
+    batched_latencies = []
+    points_read = 0
+    for start, end, activity in windows:
+        started = time.perf_counter()
+        tracks = dbh.get_activity_tracks(start, end, activity)
+        tracks_latencies.append(time.perf_counter() - started)
+        for track in tracks:
+            started = time.perf_counter()
+            points_read += len(dbh.get_track_points(track))
+            points_latencies.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        for track, start_time, points in dbh.get_activity_track_points(start, end, activity):
+            pass
+        batched_latencies.append(time.perf_counter() - started)
+    dbh.close_connection()
+    return {'get_activity_tracks': percentiles(tracks_latencies), 'get_track_points': percentiles(points_latencies),
+            'get_activity_track_points': percentiles(batched_latencies), 'points_read': points_read}
+
+
+def bench_render(db_file: str, windows: list[tuple], output_format: str, work_dir: str) -> dict:
+    latencies = []
+    sizes = []
+    failures = 0
+    for i, (start, end, activity) in enumerate(windows):
+        output_file = os.path.join(work_dir, 'map{}.html'.format(i))
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, TRACK_MAP, 'create_map', '--db_file', db_file, '--start_date', start,
+                                 '--end_date', end, '--activity', activity, '--html_output', output_file,
+                                 '--output_format', output_format], stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, text=True)
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            failures += 1
+            print("create_map failed: {}".format(result.stderr.strip().splitlines()[-1:]))
+            continue
+        latencies.append(elapsed)
+        sizes.append(os.path.getsize(output_file))
+    return {'output_format': output_format, 'create_map': percentiles(latencies), 'failures': failures,
+            'mean_html_kb': sum(sizes) / len(sizes) / 1024 if sizes else None}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark import, queries and map rendering on a synthetic archive')
+    parser.add_argument('--files', type=int, default=200, help='Number of synthetic GPX files')
+    parser.add_argument('--points', type=int, default=1000, help='Points per track')
+    parser.add_argument('--activities', type=str, default='Cycling,Running,Walking',
+                        help='Comma separated activities of the tracks')
+    parser.add_argument('--start_date', type=str, default='2020-01-01', help='Date of the first possible track')
+    parser.add_argument('--days', type=int, default=365, help='Number of days the tracks are spread over')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed of the archive and the queries')
+    parser.add_argument('--storage', type=str, default='rows', choices=['rows', 'packed'], help='DB storage mode')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes parsing GPX files')
+    parser.add_argument('--batch_size', type=int, default=200, help='Files stored in one DB transaction')
+    parser.add_argument('--queries', type=int, default=50, help='Number of random date range queries')
+    parser.add_argument('--window_days', type=int, default=30, help='Length of the queried date ranges')
+    parser.add_argument('--renders', type=int, default=5, help='Number of create_map runs, 0 to skip rendering')
+    parser.add_argument('--output_format', type=str, default='compact', choices=['folium', 'compact'],
+                        help='Map output format of the rendering benchmark')
+    parser.add_argument('--work_dir', type=str, help='Directory for the archive and DB, a temporary one by default')
+    parser.add_argument('--output', type=str, help='JSON file the results are written to')
+    args = parser.parse_args()
+
+    activities = args.activities.split(',')
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        work_dir = args.work_dir or temporary_dir
+        archive_dir = os.path.join(work_dir, 'archive')
+        db_file = os.path.join(work_dir, 'benchmark.db')
+        if os.path.exists(db_file):
+            os.remove(db_file)
+        started = time.perf_counter()
+        generate_archive(archive_dir, args.files, args.points, activities, args.start_date, args.days, args.seed)
+        print("generated {} files in {:.1f}s".format(args.files, time.perf_counter() - started))
+
+        results = {'parameters': vars(args), 'python': platform.python_version(), 'platform': platform.platform()}
+        results['ingest'] = run_isolated(bench_ingest, archive_dir, db_file, args.storage, args.workers,
+                                         args.batch_size)
+        print("ingest: {:.0f} points/s".format(results['ingest']['points_per_s']))
+        rng = random.Random(args.seed)
+        windows = random_windows(rng, activities, args.start_date, args.days, args.window_days, args.queries)
+        results['query'] = run_isolated(bench_queries, db_file, windows)
+        print("query: get_activity_track_points p50 {:.2f} ms".format(
+            results['query']['get_activity_track_points']['p50_ms']))
+        if args.renders > 0:
+            results['render'] = run_isolated(bench_render, db_file, windows[:args.renders], args.output_format,
+                                             work_dir)
+            print("render: create_map p50 {}".format(results['render']['create_map'].get('p50_ms')))
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
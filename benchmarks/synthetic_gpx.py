@@ -0,0 +1,78 @@
+import datetime
+import math
+import os
+import random
+
+"""
+Deterministic generator of SportsTracker style GPX archives for benchmarks. The same arguments and seed always give
+the same files: file names follow the SportsTracker-<activity>-<date>-<track id>.gpx format the import expects and
+each track is a random walk with elevation, time and heart rate like the SportsTracker exports.
+"""
+
+GPX_HEADER = ('<?xml version="1.0" encoding="UTF-8" standalone="no"?><gpx xmlns="http://www.topografix.com/GPX/1/1" '
+              'xmlns:gpxtpx="http://www.garmin.com/xmlschemas/TrackPointExtension/v1" '
+              'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" creator="Sports Tracker" version="1.1" '
+              'xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd '
+              'http://www.garmin.com/xmlschemas/TrackPointExtension/v1 '
+              'http://www.garmin.com/xmlschemas/TrackPointExtensionv1.xsd"><metadata><name/><desc/><author>'
+              '<name>Synthetic</name></author></metadata><trk><name/><trkseg>')
+GPX_POINT = ('<trkpt lat="{:.6f}" lon="{:.6f}"><ele>{:.1f}</ele><time>{}</time><extensions>'
+             '<gpxtpx:TrackPointExtension><gpxtpx:hr>{}</gpxtpx:hr></gpxtpx:TrackPointExtension></extensions></trkpt>')
+GPX_FOOTER = '</trkseg></trk></gpx>'
+
+# typical speeds in m/s
+ACTIVITY_SPEEDS = {'Cycling': 6.0, 'Running': 3.0, 'Walking': 1.4, 'AlpineSkiing': 8.0}
+
+
+def track_xml(rng: random.Random, start: datetime.datetime, points: int, speed: float, center: tuple) -> str:
+    """
+    Returns the GPX document of one random walk track
+    """
+    lat = center[0] + rng.uniform(-0.2, 0.2)
+    lon = center[1] + rng.uniform(-0.4, 0.4)
+    ele = rng.uniform(0, 200)
+    heading = rng.uniform(0, 2 * math.pi)
+    point_time = start
+    parts = [GPX_HEADER]
+    for _ in range(points):
+        parts.append(GPX_POINT.format(lat, lon, ele, point_time.strftime('%Y-%m-%dT%H:%M:%SZ'), rng.randint(90, 170)))
+        seconds = rng.randint(1, 5)
+        heading += rng.gauss(0, 0.3)
+        step = speed * seconds * rng.uniform(0.5, 1.5)
+        lat += step * math.cos(heading) / 111195.0
+        lon += step * math.sin(heading) / (111195.0 * math.cos(math.radians(lat)))
+        ele = max(0.0, ele + rng.gauss(0, 0.5))
+        point_time += datetime.timedelta(seconds=seconds)
+    parts.append(GPX_FOOTER)
+    return ''.join(parts)
+
+
+def generate_archive(directory: str, files: int = 100, points_per_track: int = 1000,
+                     activities: [str] = ('Cycling', 'Running', 'Walking'), start_date: str = '2020-01-01',
+                     days: int = 365, seed: int = 1, center: tuple = (60.17, 24.94)) -> [str]:
+    """
+    Write a synthetic archive of SportsTracker GPX files
+    :param directory: where the files are written, created when missing
+    :param files: number of track files
+    :param points_per_track: number of points in each track
+    :param activities: activity types picked at random for the tracks
+    :param start_date: date of the first possible track in format %Y-%m-%d
+    :param days: tracks are spread over this many days from the start date
+    :param seed: random seed, the same seed gives the same archive
+    :param center: (lat, lon) around which the tracks are
+    :return: the written file names
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    first_day = datetime.datetime.strptime(start_date, '%Y-%m-%d')
+    filenames = []
+    for _ in range(files):
+        activity = rng.choice(list(activities))
+        start = first_day + datetime.timedelta(days=rng.randrange(days), seconds=rng.randrange(6 * 3600, 20 * 3600))
+        track_id = '{:024x}'.format(rng.getrandbits(96))
+        filename = os.path.join(directory, 'SportsTracker-{}-{}-{}.gpx'.format(activity, start.strftime('%Y%m%d'),
+                                                                              track_id))
+        with open(filename, 'w') as f:
+            f.write(track_xml(rng, start, points_per_track, ACTIVITY_SPEEDS.get(activity, 3.0), center))
+        filenames.append(filename)
+    return filenames
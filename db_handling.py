@@ -1,13 +1,99 @@
+import hashlib
+import logging
+import math
+import os
 import sqlite3
-import gpxpy
-from file_handling import GPXFileHandling
+import sys
+import time
+from array import array
+from itertools import chain, groupby, islice
+from urllib.parse import quote
+from file_handling import parse_track_file, parse_track_files
+from gpx_reader import points_to_columns
+from instrumentation import metrics
+from simplify import downsample_by_time, simplify_track
+from track_stats import TRACK_STATS_COLUMNS, TrackSummary, bbox_around, compute_track_stats, haversine_m, \
+    summarize_track, time_to_epoch
+
+SCHEMA_VERSION = 10
+
+# how points of a track are stored: one row per point or packed float64 arrays in one row per track
+STORAGE_ROWS = 'rows'
+STORAGE_PACKED = 'packed'
+
+# number of rows fetched at a time when streaming points
+FETCH_CHUNK_ROWS = 4096
+
+logger = logging.getLogger(__name__)
+
+
+
+def tracks_filter(start: str = None, end: str = None, activity: str = None, track_ids: [int] = None) -> tuple:
+    """
+    Build the WHERE condition selecting tracks (aliased t) with points between two dates, leaving out the
+    conditions that are not given so that the (activity, start_time) or the (start_time) index can be used
+    :param start: first date (included) in format %Y-%m-%d
+    :param end: last date (included) in format %Y-%m-%d
+    :param activity: the activity type
+    :param track_ids: only these tracks
+    :return: the condition and its parameters
+    """
+    conditions = []
+    params = []
+    if activity is not None:
+        conditions.append("t.activity = ?")
+        params.append(activity)
+    if end is not None:
+        conditions.append("t.start_time < date(?, '+1 day')")
+        params.append(end)
+    if start is not None:
+        conditions.append("t.end_time >= date(?)")
+        params.append(start)
+    if track_ids is not None:
+        conditions.append("t.id IN ({})".format(", ".join("?" * len(track_ids))))
+        params.extend(track_ids)
+    return " AND ".join(conditions) or "1", tuple(params)
+
+
+def pack_column(values) -> bytes:
+    """
+    Pack a column of numbers to little endian float64 bytes
+    """
+    packed = array('d', values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_column(blob: bytes):
+    """
+    Returns a float64 view of a packed column. On little endian machines the view is a zero-copy memoryview
+    of the blob, otherwise a byte swapped array copy.
+    """
+    if sys.byteorder == 'big':
+        values = array('d', blob)
+        values.byteswap()
+        return values
+    return memoryview(blob).cast('d')
 
 
 class DBHandling:
-    def __init__(self, db_filename):
+    def __init__(self, db_filename, storage: str = STORAGE_ROWS, read_only: bool = False):
+        """
+        :param db_filename: the DB file, created when missing unless opened read only
+        :param storage: how new tracks are stored, STORAGE_ROWS or STORAGE_PACKED
+        :param read_only: open an existing DB without write access, the connection can then be used from other
+        threads than the one that opened it (one thread at a time)
+        """
         self.connection = None
         self.db_name = db_filename
-        self.connection = sqlite3.connect(self.db_name)
+        self.storage = storage
+        self.read_only = read_only
+        if read_only:
+            uri = 'file:{}?mode=ro'.format(quote(os.path.abspath(self.db_name)))
+            self.connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            self.connection = sqlite3.connect(self.db_name)
 
     def connect_to_db(self, db_name: str = 'gps_data.db'):
         self.db_name = db_name
@@ -19,135 +105,897 @@ class DBHandling:
         return self.connection.close()
 
 
+    def get_schema_version(self) -> int:
+        """
+        Returns the schema version stored in the DB file, 0 for an empty DB or the original gpx_data table
+        """
+        return self.connection.execute("PRAGMA user_version").fetchone()[0]
+
+    def table_exists(self, table_name: str) -> bool:
+        result = self.connection.execute("SELECT name FROM sqlite_schema WHERE type = 'table' AND name = ?",
+                                         (table_name,)).fetchall()
+        return len(result) > 0
+
     def create_gpx_table(self):
-        c = self.connection.cursor()
-        table_name = 'gpx_data'
-        table_query = '''SELECT name FROM sqlite_schema  
-                            WHERE type='table' 
-                            AND name='{}';'''.format(table_name)
-        c.execute(table_query)
-        result = c.fetchall()
-        if len(result) > 0:
-            # table already exists
+        """
+        Create the track tables or migrate an existing DB file in place to the current schema version
+        :return: True when the DB is ready to be used
+        """
+        version = self.get_schema_version()
+        if version >= SCHEMA_VERSION:
             return True
-        # Create a table to store GPX data
+        c = self.connection.cursor()
+        c.execute("BEGIN")
+        try:
+            if version < 2:
+                self.create_schema_v2(c)
+            if version < 3:
+                self.create_schema_v3(c)
+            if version < 4:
+                self.create_schema_v4(c)
+            if version < 5:
+                self.create_schema_v5(c)
+            if version < 6:
+                self.create_schema_v6(c)
+            if version < 7:
+                self.create_schema_v7(c)
+            if version < 8:
+                self.create_schema_v8(c)
+            if version < 9:
+                self.create_schema_v9(c)
+            if version < 10:
+                self.create_schema_v10(c)
+            c.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+        except sqlite3.Error:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+        return True
+
+    def create_schema_v2(self, c) -> None:
+        """
+        Schema version 2: one row per track in tracks and the points keyed by track id and sequence number.
+        Points of a version 1 gpx_data table are moved to the new tables and gpx_data is replaced by a view.
+        """
         c.execute('''
-            CREATE TABLE IF NOT EXISTS gpx_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                track_name TEXT,
+            CREATE TABLE IF NOT EXISTS tracks (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                activity TEXT,
+                start_time TEXT,
+                end_time TEXT,
+                point_count INTEGER NOT NULL DEFAULT 0,
+                min_lat REAL,
+                min_lon REAL,
+                max_lat REAL,
+                max_lon REAL
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS points (
+                track_id INTEGER NOT NULL REFERENCES tracks(id),
+                seq INTEGER NOT NULL,
                 latitude REAL,
                 longitude REAL,
                 elevation REAL,
                 time TEXT,
-                activity_type TEXT
+                PRIMARY KEY (track_id, seq)
+            ) WITHOUT ROWID
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS tracks_activity_start ON tracks (activity, start_time)")
+        if self.table_exists('gpx_data'):
+            logger.info("Migrating gpx_data table to schema version 2")
+            # placeholder rows of tracks without points have an empty string as latitude
+            c.execute('''
+                INSERT INTO tracks (name, activity, start_time, end_time, point_count,
+                                    min_lat, min_lon, max_lat, max_lon)
+                SELECT track_name, MIN(activity_type), MIN(time), MAX(time), SUM(typeof(latitude) = 'real'),
+                       MIN(CASE WHEN typeof(latitude) = 'real' THEN latitude END),
+                       MIN(CASE WHEN typeof(longitude) = 'real' THEN longitude END),
+                       MAX(CASE WHEN typeof(latitude) = 'real' THEN latitude END),
+                       MAX(CASE WHEN typeof(longitude) = 'real' THEN longitude END)
+                FROM gpx_data GROUP BY track_name
+            ''')
+            c.execute('''
+                INSERT INTO points (track_id, seq, latitude, longitude, elevation, time)
+                SELECT t.id, ROW_NUMBER() OVER (PARTITION BY g.track_name ORDER BY g.id) - 1,
+                       g.latitude, g.longitude, g.elevation, g.time
+                FROM gpx_data g JOIN tracks t ON t.name = g.track_name
+                WHERE typeof(g.latitude) = 'real'
+            ''')
+            c.execute("DROP TABLE gpx_data")
+        # keep the flat view of the points available for ad hoc queries
+        c.execute('''
+            CREATE VIEW IF NOT EXISTS gpx_data AS
+            SELECT t.name AS track_name, p.latitude, p.longitude, p.elevation, p.time, t.activity AS activity_type
+            FROM points p JOIN tracks t ON t.id = p.track_id
+        ''')
+
+    def create_schema_v3(self, c) -> None:
+        """
+        Schema version 3: tracks can be stored packed, with all point columns as float64 arrays in one track_blobs row
+        """
+        c.execute("ALTER TABLE tracks ADD COLUMN storage TEXT NOT NULL DEFAULT '{}'".format(STORAGE_ROWS))
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS track_blobs (
+                track_id INTEGER PRIMARY KEY REFERENCES tracks(id),
+                latitudes BLOB NOT NULL,
+                longitudes BLOB NOT NULL,
+                elevations BLOB NOT NULL,
+                times BLOB NOT NULL
             )
         ''')
-        self.connection.commit()
-        return True
 
+    def create_schema_v4(self, c) -> None:
+        """
+        Schema version 4: cache of simplified track geometry per simplification method and tolerance in meters
+        """
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS track_simplified (
+                track_id INTEGER NOT NULL REFERENCES tracks(id),
+                method TEXT NOT NULL,
+                tolerance REAL NOT NULL,
+                latitudes BLOB NOT NULL,
+                longitudes BLOB NOT NULL,
+                PRIMARY KEY (track_id, method, tolerance)
+            ) WITHOUT ROWID
+        ''')
+
+    def create_schema_v5(self, c) -> None:
+        """
+        Schema version 5: manifest of imported files so that unchanged files are skipped by looking at their size
+        and modification time only
+        """
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_manifest (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                track_name TEXT
+            )
+        ''')
+
+    def create_schema_v6(self, c) -> None:
+        """
+        Schema version 6: distance, speed and elevation statistics on the track rows. Statistics of the tracks
+        already in the DB are calculated from their points.
+        """
+        for name in TRACK_STATS_COLUMNS:
+            c.execute("ALTER TABLE tracks ADD COLUMN {} REAL".format(name))
+        for track_id, track_name in c.execute("SELECT id, name FROM tracks").fetchall():
+            self.update_track_stats(c, track_id, compute_track_stats(*self.get_track_arrays(track_name)))
+
+    def create_schema_v7(self, c) -> None:
+        """
+        Schema version 7: R*Tree index of the track bounding boxes. Without the SQLite R*Tree module area queries
+        fall back to the bounding box columns of the tracks table.
+        """
+        try:
+            c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS tracks_rtree
+                         USING rtree(id, min_lat, max_lat, min_lon, max_lon)''')
+        except sqlite3.OperationalError as e:
+            logger.warning("R*Tree index not available, area queries scan the track bounding boxes: {}".format(e))
+            return
+        c.execute('''INSERT INTO tracks_rtree (id, min_lat, max_lat, min_lon, max_lon)
+                     SELECT id, min_lat, max_lat, min_lon, max_lon FROM tracks WHERE point_count > 0''')
 
-    def insert_track_to(self, track_name, activity, points, date=""):
+    def create_schema_v8(self, c) -> None:
+        """
+        Schema version 8: revision number of each track, increased every time the track is replaced
+        """
+        c.execute("ALTER TABLE tracks ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+
+    def create_schema_v9(self, c) -> None:
+        """
+        Schema version 9: segment number and epoch time of the points, per segment summaries and a cache of tracks
+        downsampled by time. The segment boundaries of tracks stored before this version are not known, each of
+        them is stored as a single segment.
+        """
+        c.execute("ALTER TABLE points ADD COLUMN segment INTEGER NOT NULL DEFAULT 0")
+        c.execute("ALTER TABLE points ADD COLUMN epoch REAL")
+        c.execute("UPDATE points SET epoch = round((julianday(time) - 2440587.5) * 86400.0, 3) WHERE time IS NOT NULL")
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS track_segments (
+                track_id INTEGER NOT NULL REFERENCES tracks(id),
+                segment INTEGER NOT NULL,
+                first_seq INTEGER NOT NULL,
+                point_count INTEGER NOT NULL,
+                start_time TEXT,
+                end_time TEXT,
+                {},
+                PRIMARY KEY (track_id, segment)
+            ) WITHOUT ROWID
+        '''.format(",\n                ".join(name + " REAL" for name in TRACK_STATS_COLUMNS)))
+        c.execute('''
+            INSERT INTO track_segments (track_id, segment, first_seq, point_count, start_time, end_time, {0})
+            SELECT id, 0, 0, point_count, start_time, end_time, {0} FROM tracks WHERE point_count > 0
+        '''.format(", ".join(TRACK_STATS_COLUMNS)))
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS track_downsampled (
+                track_id INTEGER NOT NULL REFERENCES tracks(id),
+                interval_s REAL NOT NULL,
+                latitudes BLOB NOT NULL,
+                longitudes BLOB NOT NULL,
+                PRIMARY KEY (track_id, interval_s)
+            ) WITHOUT ROWID
+        ''')
+
+    def create_schema_v10(self, c) -> None:
+        """
+        Schema version 10: index of the track start times. Without an activity the (activity, start_time) index
+        cannot be used, and the tracks would be sorted with all of their points before the first one is streamed.
+        """
+        c.execute("CREATE INDEX IF NOT EXISTS tracks_start ON tracks (start_time)")
+
+    def set_import_pragmas(self, journal_mode: str = 'WAL', synchronous: str = 'NORMAL',
+                           cache_size: int = -65536) -> None:
+        """
+        Tune the connection for large import runs
+        :param journal_mode: SQLite journal mode, e.g. WAL, MEMORY or DELETE
+        :param synchronous: SQLite synchronous level, e.g. OFF, NORMAL or FULL
+        :param cache_size: page cache size, negative values are in KiB as in SQLite
+        :return: None
+        """
         c = self.connection.cursor()
-        if not points:
+        c.execute("PRAGMA journal_mode = {}".format(journal_mode))
+        c.execute("PRAGMA synchronous = {}".format(synchronous))
+        c.execute("PRAGMA cache_size = {}".format(int(cache_size)))
+        c.execute("PRAGMA temp_store = MEMORY")
+
+    def insert_track_to(self, track_name, activity, points, date="", commit: bool = True) -> int:
+        """
+        Insert the points of one track, replacing any earlier version of the track
+        :param track_name: the track identifier
+        :param activity: the activity type of the track
+        :param points: iterable of gpxpy track points
+        :param date: start date stored for a track without any points
+        :param commit: commit the transaction after inserting, disable for batched imports
+        :return: number of inserted points
+        """
+        return self.insert_track_columns(track_name, activity, points_to_columns(points), date, commit)
+
+    def insert_track_columns(self, track_name, activity, columns, date="", commit: bool = True,
+                             summary: TrackSummary = None) -> int:
+        """
+        Insert the points of one track given as columns, as returned by parse_track_file. An existing track with the
+        same name is replaced.
+        :param track_name: the track identifier
+        :param activity: the activity type of the track
+        :param columns: tuple of latitudes, longitudes, elevations, times and optionally segment numbers, all points
+        are in segment 0 when the segment numbers are not given
+        :param date: start date stored for a track without any points
+        :param commit: commit the transaction after inserting, disable for batched imports
+        :param summary: the summary of the columns calculated by summarize_track, e.g. by parse_track_file in a
+        worker process, calculated here when not given
+        :return: number of inserted points
+        """
+        latitudes, longitudes, elevations, times = columns[:4]
+        segments = columns[4] if len(columns) > 4 else array('i', bytes(array('i').itemsize * len(latitudes)))
+        if summary is None:
+            summary = summarize_track(latitudes, longitudes, elevations, times, segments)
+        epochs = summary.epochs
+        start_time = summary.start_time if summary.start_time is not None else date
+        end_time = summary.end_time if summary.end_time is not None else date
+        if len(latitudes) > 0:
+            bbox = (min(latitudes), min(longitudes), max(latitudes), max(longitudes))
+        else:
+            bbox = (None, None, None, None)
+        c = self.connection.cursor()
+        track_id = self.replace_track(c, track_name, activity, start_time, end_time, len(latitudes), bbox)
+        self.update_track_stats(c, track_id, summary.stats)
+        self.insert_track_segments(c, track_id, summary.segments)
+        if self.storage == STORAGE_PACKED:
             c.execute('''
-                INSERT INTO gpx_data (track_name, latitude, longitude, elevation, time, activity_type)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (track_name, "", "", "", date, activity))
+                INSERT INTO track_blobs (track_id, latitudes, longitudes, elevations, times) VALUES (?, ?, ?, ?, ?)
+            ''', (track_id, pack_column(latitudes), pack_column(longitudes), pack_column(elevations),
+                  pack_column(epochs)))
         else:
-            for point in points:
-                c.execute('''
-                    INSERT INTO gpx_data (track_name, latitude, longitude, elevation, time, activity_type)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (track_name, point.latitude, point.longitude, point.elevation, point.time, activity))
-        self.connection.commit()
+            c.executemany('''
+                INSERT INTO points (track_id, seq, latitude, longitude, elevation, time, segment, epoch)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', ((track_id, seq, lat, lon, None if math.isnan(ele) else ele, time_text, segment,
+                   None if math.isnan(epoch) else epoch)
+                  for seq, (lat, lon, ele, time_text, segment, epoch)
+                  in enumerate(zip(latitudes, longitudes, elevations, times, segments, epochs))))
+        if commit:
+            self.connection.commit()
+        return len(latitudes)
+
+    def replace_track(self, c, track_name, activity, start_time, end_time, point_count, bbox) -> int:
+        """
+        Insert the track row or update it and remove its old points when the track is already stored
+        :return: the id of the track
+        """
+        row = c.execute("SELECT id FROM tracks WHERE name = ?", (track_name,)).fetchone()
+        if row is None:
+            c.execute('''
+                INSERT INTO tracks (name, activity, start_time, end_time, point_count,
+                                    min_lat, min_lon, max_lat, max_lon, storage)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (track_name, activity, start_time, end_time, point_count) + tuple(bbox) + (self.storage,))
+            track_id = c.lastrowid
+            self.index_track_bbox(c, track_id, bbox)
+            return track_id
+        track_id = row[0]
+        c.execute("DELETE FROM points WHERE track_id = ?", (track_id,))
+        c.execute("DELETE FROM track_blobs WHERE track_id = ?", (track_id,))
+        c.execute("DELETE FROM track_simplified WHERE track_id = ?", (track_id,))
+        c.execute("DELETE FROM track_segments WHERE track_id = ?", (track_id,))
+        c.execute("DELETE FROM track_downsampled WHERE track_id = ?", (track_id,))
+        if self.table_exists('tracks_rtree'):
+            c.execute("DELETE FROM tracks_rtree WHERE id = ?", (track_id,))
+        c.execute('''
+            UPDATE tracks SET activity = ?, start_time = ?, end_time = ?, point_count = ?,
+                              min_lat = ?, min_lon = ?, max_lat = ?, max_lon = ?, storage = ?, revision = revision + 1
+            WHERE id = ?
+        ''', (activity, start_time, end_time, point_count) + tuple(bbox) + (self.storage, track_id))
+        self.index_track_bbox(c, track_id, bbox)
+        return track_id
+
+    def index_track_bbox(self, c, track_id: int, bbox: tuple) -> None:
+        """
+        Add the bounding box (min_lat, min_lon, max_lat, max_lon) of a track with points to the R*Tree index
+        """
+        if bbox[0] is None or not self.table_exists('tracks_rtree'):
+            return
+        c.execute("INSERT INTO tracks_rtree (id, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)",
+                  (track_id, bbox[0], bbox[2], bbox[1], bbox[3]))
 
+    def insert_track_segments(self, c, track_id: int, segments: list) -> None:
+        """
+        Store the point range, time range and statistics of each segment of a track
+        :param segments: the SegmentSummary of each segment calculated by summarize_track
+        """
+        for segment in segments:
+            c.execute('''INSERT INTO track_segments
+                         (track_id, segment, first_seq, point_count, start_time, end_time, {})
+                         VALUES (?, ?, ?, ?, ?, ?, {})'''.format(", ".join(TRACK_STATS_COLUMNS),
+                                                              ", ".join("?" for _ in TRACK_STATS_COLUMNS)),
+                      (track_id, segment.segment, segment.first_seq, segment.point_count, segment.start_time,
+                       segment.end_time) + tuple(segment.stats[name] for name in TRACK_STATS_COLUMNS))
+
+    def update_track_stats(self, c, track_id: int, stats: dict) -> None:
+        """
+        Store the statistics calculated by compute_track_stats on the track row
+        """
+        c.execute("UPDATE tracks SET {} WHERE id = ?".format(", ".join(name + " = ?" for name in TRACK_STATS_COLUMNS)),
+                  tuple(stats[name] for name in TRACK_STATS_COLUMNS) + (track_id,))
 
-    def store_gpx_points(self, filename: str):
+    def store_gpx_points(self, filename: str, commit: bool = True) -> int:
         """
         Read GPX file for content and insert values to database
         :param filename: the filename
-        :return: was storing successful or not
-        """
-        fh = GPXFileHandling()
-        track_name = fh.track_name_from_filename(filename)
-        track_date = fh.date_from_filename(filename)
-        activity = fh.activity_from_filename(filename)
-        # print("storing to DB track name '{}' and activity '{}'".format(track_name, activity))
-        # Parse GPX file and insert data
-        with open(filename, 'r') as gpx_file:
-            gpx = gpxpy.parse(gpx_file)
-            if not gpx.tracks:
-                self.insert_track_to(track_name, activity, [], track_date)
-            else:
-                for track in gpx.tracks:
-                    points = []
-                    for segment in track.segments:
-                        points.extend(segment.points)
-                    self.insert_track_to(track_name, activity, points)
-            print("store_gpx_points: {}: {}".format(track_name, gpx.tracks))
-        return None
+        :param commit: commit after the file is stored, disable for batched imports
+        :return: number of points stored
+        """
+        track_name, activity, track_date, columns, summary = parse_track_file(filename)
+        return self.insert_track_columns(track_name, activity, columns, track_date, commit, summary)
+
+    def bulk_store_gpx_files(self, filenames: [str], batch_size: int = 200, workers: int = 1,
+                             fingerprints: dict = None) -> int:
+        """
+        Store many GPX files using one transaction per batch of files. With more than one worker the files are
+        parsed in a process pool while this connection stays the only writer.
+        :param filenames: the GPX files to store
+        :param batch_size: number of files committed in one transaction
+        :param workers: number of processes parsing the files
+        :param fingerprints: optional (size, mtime_ns, content_hash) per filename, recorded to the ingest manifest
+        in the same transaction as the track
+        :return: number of points stored
+        """
+        started = time.perf_counter()
+        total_rows = 0
+        parsed_tracks = parse_track_files(filenames, workers)
+        stored_files = 0
+        while True:
+            with metrics.phase('parse'):
+                batch = list(islice(parsed_tracks, batch_size))
+            if not batch:
+                break
+            try:
+                with metrics.phase('insert'):
+                    for filename, (track_name, activity, track_date, columns, summary) in \
+                            zip(filenames[stored_files:stored_files + len(batch)], batch):
+                        total_rows += self.insert_track_columns(track_name, activity, columns, track_date,
+                                                                commit=False, summary=summary)
+                        if fingerprints is not None:
+                            self.record_ingested_file(filename, *fingerprints[filename], track_name)
+            except BaseException:
+                self.connection.rollback()
+                # stop the workers instead of waiting for them to parse the rest of the files
+                parsed_tracks.close()
+                raise
+            with metrics.phase('commit'):
+                self.connection.commit()
+            stored_files += len(batch)
+            metrics.count('files', len(batch))
+        metrics.count('points', total_rows)
+        elapsed = time.perf_counter() - started
+        logger.info("bulk_store_gpx_files: stored {} rows from {} files in {:.2f}s ({:.0f} rows/s)".format(
+            total_rows, len(filenames), elapsed, total_rows / elapsed if elapsed > 0 else 0))
+        return total_rows
+
+    def get_ingest_manifest(self) -> dict:
+        """
+        Returns the ingest manifest as a dict of path to (size, mtime_ns, content_hash)
+        """
+        cursor = self.connection.execute("SELECT path, size, mtime_ns, content_hash FROM ingest_manifest")
+        return {path: (size, mtime_ns, content_hash) for path, size, mtime_ns, content_hash in cursor}
+
+    def record_ingested_file(self, path: str, size: int, mtime_ns: int, content_hash: str, track_name: str) -> None:
+        """
+        Add or update the manifest entry of an imported file, the caller commits
+        """
+        self.connection.execute('''INSERT OR REPLACE INTO ingest_manifest
+                                   (path, size, mtime_ns, content_hash, track_name) VALUES (?, ?, ?, ?, ?)''',
+                                (path, size, mtime_ns, content_hash, track_name))
 
     def get_all_track_names(self) -> [str]:
         """
         Returns all track names from the DB
         """
-        sql_query = "SELECT DISTINCT track_name FROM gpx_data"
         cursor = self.connection.cursor()
-        cursor.execute(sql_query)
-        results = cursor.fetchall()
-        track_names = []
-        for r in results:
-            track_names.append(r[0])
-        print("tracks already in DB: {}", len(track_names))
+        cursor.execute("SELECT name FROM tracks")
+        track_names = [r[0] for r in cursor.fetchall()]
+        logger.debug("tracks already in DB: {}".format(len(track_names)))
         return track_names
 
     def get_activity_tracks(self, start: str, end: str, activity: str) -> [str]:
-        sql_query = '''SELECT DISTINCT(track_name) FROM gpx_data 
-                        WHERE date(time) >= date('{}') 
-                        AND date(time) <= date('{}') 
-                        AND activity_type = '{}' ORDER BY date(time);
-        '''.format(start, end, activity)
+        """
+        Returns the names of the tracks of an activity that have points between the start and end dates
+        :param start: first date (included) in format %Y-%m-%d
+        :param end: last date (included) in format %Y-%m-%d
+        :param activity: the activity type, None for all activities
+        :return: track names ordered by start time
+        """
+        condition, params = tracks_filter(start, end, activity)
+        sql_query = '''SELECT t.name FROM tracks t
+                        WHERE {}
+                        ORDER BY t.start_time;
+        '''.format(condition)
         try:
             cursor = self.connection.cursor()
-            cursor.execute(sql_query)
-            result = cursor.fetchall()
-            print("DB returned these tracks: {}".format(result))
-            # clean the results
-            tracks = []
-            for res in result:
-                tracks.append(res[0])
+            with metrics.phase('query'):
+                cursor.execute(sql_query, params)
+                tracks = [res[0] for res in cursor.fetchall()]
+            logger.debug("DB returned these tracks: {}".format(tracks))
             return tracks
         except sqlite3.Error as e:
-            print(e)
-            print("Connection error - could not retrieve requested tracks: {}".format(sql_query))
+            logger.error("Connection error - could not retrieve requested tracks: {}\n{}".format(e, sql_query))
         return []
 
+    def get_tracks(self, start: str = None, end: str = None, activity: str = None) -> list[tuple]:
+        """
+        Returns the tracks with points between the start and end dates
+        :param start: first date (included) in format %Y-%m-%d, None for no limit
+        :param end: last date (included) in format %Y-%m-%d, None for no limit
+        :param activity: the activity type, None for all activities
+        :return: list of (id, name, activity, start time) ordered by activity and start time
+        """
+        condition, params = tracks_filter(start, end, activity)
+        with metrics.phase('query'):
+            return self.connection.execute('''SELECT t.id, t.name, t.activity, t.start_time FROM tracks t
+                                              WHERE t.point_count > 0 AND {}
+                                              ORDER BY t.activity, t.start_time, t.id'''.format(condition),
+                                           params).fetchall()
+
+    def get_period_stats(self, start: str, end: str, activity: str = None) -> list[dict]:
+        """
+        Summarize the track statistics of a period per activity, using only the tracks table
+        :param start: first date (included) in format %Y-%m-%d
+        :param end: last date (included) in format %Y-%m-%d
+        :param activity: the activity type, None for all activities
+        :return: one dict per activity with track count, total distance, moving time and ascent, max speed,
+        average moving speed and elevation range
+        """
+        condition, params = tracks_filter(start, end, activity)
+        sql_query = '''SELECT t.activity, COUNT(*), SUM(t.distance_m), SUM(t.moving_time_s), MAX(t.max_speed_mps),
+                               SUM(t.avg_speed_mps * t.moving_time_s) / NULLIF(SUM(t.moving_time_s), 0),
+                               MIN(t.min_elevation), MAX(t.max_elevation), SUM(t.ascent_m)
+                        FROM tracks t
+                        WHERE {}
+                        GROUP BY t.activity ORDER BY t.activity;
+        '''.format(condition)
+        summaries = []
+        try:
+            cursor = self.connection.cursor()
+            with metrics.phase('query'):
+                rows = cursor.execute(sql_query, params).fetchall()
+            for (track_activity, tracks, distance, moving_time, max_speed, avg_speed, min_elevation, max_elevation,
+                 ascent) in rows:
+                summaries.append({
+                    'activity': track_activity,
+                    'tracks': tracks,
+                    'distance_m': distance,
+                    'moving_time_s': moving_time,
+                    'max_speed_mps': max_speed,
+                    'avg_speed_mps': avg_speed,
+                    'min_elevation': min_elevation,
+                    'max_elevation': max_elevation,
+                    'ascent_m': ascent,
+                })
+        except sqlite3.Error as e:
+            logger.error("Connection error - could not retrieve requested statistics: {}\n{}".format(e, sql_query))
+        return summaries
+
+    def get_tracks_in_area(self, bbox: tuple = None, near: tuple = None, start: str = None, end: str = None,
+                           activity: str = None) -> [int]:
+        """
+        Find the tracks that have a point inside a bounding box or within a radius of a location. Candidates are
+        picked by their bounding boxes from the R*Tree index and then checked point by point.
+        :param bbox: (min_lat, min_lon, max_lat, max_lon)
+        :param near: (lat, lon, radius in meters)
+        :param start: first date (included) in format %Y-%m-%d
+        :param end: last date (included) in format %Y-%m-%d
+        :param activity: the activity type, None for all activities
+        :return: ids of the matching tracks ordered by start time
+        """
+        if near is not None:
+            bbox = bbox_around(*near)
+        min_lat, min_lon, max_lat, max_lon = bbox
+        condition, params = tracks_filter(start, end, activity)
+        if self.table_exists('tracks_rtree'):
+            candidates_query = '''SELECT t.id, t.name FROM tracks_rtree r JOIN tracks t ON t.id = r.id
+                                   WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+                                   AND {} ORDER BY t.start_time'''.format(condition)
+        else:
+            candidates_query = '''SELECT t.id, t.name FROM tracks t
+                                   WHERE t.max_lat >= ? AND t.min_lat <= ? AND t.max_lon >= ? AND t.min_lon <= ?
+                                   AND {} ORDER BY t.start_time'''.format(condition)
+        with metrics.phase('query'):
+            candidates = self.connection.execute(candidates_query,
+                                                 (min_lat, max_lat, min_lon, max_lon) + params).fetchall()
+            track_ids = []
+            for track_id, track_name in candidates:
+                latitudes, longitudes = self.get_track_arrays(track_name)[:2]
+                for lat, lon in zip(latitudes, longitudes):
+                    if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon and \
+                            (near is None or haversine_m(near[0], near[1], lat, lon) <= near[2]):
+                        track_ids.append(track_id)
+                        break
+        logger.info("{} of {} candidate tracks are in the area".format(len(track_ids), len(candidates)))
+        return track_ids
+
+    def get_tracks_with_bbox_near(self, bbox: tuple, distance_m: float, start: str = None, end: str = None,
+                                  activity: str = None) -> list[tuple]:
+        """
+        Find the tracks whose bounding box edges are all within a distance of the edges of a bounding box. A track
+        that stays within the distance of a route and reaches within the distance of each of its points has to pass
+        this test, so route matching picks its candidates with this from the R*Tree index without reading points.
+        :param bbox: (min_lat, min_lon, max_lat, max_lon) of the route
+        :param distance_m: the max distance in meters
+        :param start: first date (included) in format %Y-%m-%d
+        :param end: last date (included) in format %Y-%m-%d
+        :param activity: the activity type, None for all activities
+        :return: list of (id, name, activity, start time) ordered by start time
+        """
+        min_lat, min_lon, max_lat, max_lon = bbox
+        # a degree of longitude is shortest at the latitude farthest from the equator
+        farthest_lat = max(abs(min_lat), abs(max_lat))
+        margin = bbox_around(farthest_lat, 0.0, distance_m)
+        lat_margin, lon_margin = margin[2] - farthest_lat, margin[3]
+        edges = (min_lat - lat_margin, min_lat + lat_margin, max_lat - lat_margin, max_lat + lat_margin,
+                 min_lon - lon_margin, min_lon + lon_margin, max_lon - lon_margin, max_lon + lon_margin)
+        edges_condition = '''{0}.min_lat BETWEEN ? AND ? AND {0}.max_lat BETWEEN ? AND ?
+                             AND {0}.min_lon BETWEEN ? AND ? AND {0}.max_lon BETWEEN ? AND ?'''
+        condition, params = tracks_filter(start, end, activity)
+        if self.table_exists('tracks_rtree'):
+            # the R*Tree keeps the boxes as 32 bit floats rounded outwards, so its ranges are widened a little and
+            # the exact edges are checked from the tracks table
+            rtree_edges = tuple(edge - 1e-4 if i % 2 == 0 else edge + 1e-4 for i, edge in enumerate(edges))
+            query = '''SELECT t.id, t.name, t.activity, t.start_time FROM tracks_rtree r JOIN tracks t ON t.id = r.id
+                       WHERE {} AND {} AND {} ORDER BY t.start_time'''.format(edges_condition.format('r'),
+                                                                             edges_condition.format('t'), condition)
+            params = rtree_edges + edges + params
+        else:
+            query = '''SELECT t.id, t.name, t.activity, t.start_time FROM tracks t
+                       WHERE {} AND {} ORDER BY t.start_time'''.format(edges_condition.format('t'), condition)
+            params = edges + params
+        with metrics.phase('query'):
+            return self.connection.execute(query, params).fetchall()
+
+    def get_change_token(self, start: str = None, end: str = None, activity: str = None) -> str:
+        """
+        Returns a token that changes whenever a track is added to or replaced in the selection
+        :param start: first date (included) in format %Y-%m-%d
+        :param end: last date (included) in format %Y-%m-%d
+        :param activity: the activity type, None for all activities
+        :return: the change token
+        """
+        condition, params = tracks_filter(start, end, activity)
+        with metrics.phase('query'):
+            row = self.connection.execute('''SELECT COUNT(*), group_concat(id || '.' || revision, ',') FROM
+                                             (SELECT t.id, t.revision FROM tracks t WHERE {} ORDER BY t.id)'''
+                                          .format(condition), params).fetchone()
+        return hashlib.sha256("{}:{}".format(row[0], row[1]).encode('utf-8')).hexdigest()
+
+    def get_tracks_bounds(self, start: str = None, end: str = None, activity: str = None,
+                          track_ids: [int] = None) -> list[(float, float)]:
+        """
+        Combine the stored bounding boxes of the selected tracks
+        :return: south west and north east corners as [(lat, lon), (lat, lon)], an empty list when no track has points
+        """
+        condition, params = tracks_filter(start, end, activity, track_ids)
+        with metrics.phase('query'):
+            row = self.connection.execute('''SELECT MIN(t.min_lat), MIN(t.min_lon), MAX(t.max_lat), MAX(t.max_lon)
+                                             FROM tracks t WHERE {}'''.format(condition), params).fetchone()
+        if row[0] is None:
+            return []
+        return [(row[0], row[1]), (row[2], row[3])]
+
+    def get_activity_track_points(self, start: str, end: str, activity: str, simplify_tolerance: float = None,
+                                  simplify_method: str = 'douglas-peucker', track_ids: [int] = None,
+                                  resolution_s: float = None):
+        """
+        Fetch the points of all tracks of an activity between the start and end dates with one query. Rows are
+        streamed from the DB and grouped by track, so only one track is held in memory at a time.
+        When a simplification tolerance or a time resolution is given, the reduced geometry cached in the DB is used
+        and the points of those tracks are not read at all. Tracks missing from the cache are reduced and added to
+        the cache.
+        :param start: first date (included) in format %Y-%m-%d
+        :param end: last date (included) in format %Y-%m-%d
+        :param activity: the activity type, None for all activities
+        :param simplify_tolerance: simplification tolerance in meters, None to get all points
+        :param simplify_method: 'douglas-peucker' or 'visvalingam'
+        :param track_ids: only these tracks, e.g. found by get_tracks_in_area
+        :param resolution_s: keep one point per this many seconds of each track segment, None to get all points.
+        The downsampled tracks are simplified when a tolerance is given too, only the downsampling is cached then.
+        :return: iterator of (track name, start time, list of (lat, lon)) ordered by start time
+        """
+        condition, params = tracks_filter(start, end, activity, track_ids)
+        if resolution_s is not None:
+            cache_join = "track_downsampled c ON c.track_id = t.id AND c.interval_s = ?"
+            cache_params = (resolution_s,)
+        else:
+            cache_join = "track_simplified c ON c.track_id = t.id AND c.method = ? AND c.tolerance = ?"
+            cache_params = (simplify_method, simplify_tolerance)
+        # times and segments are only needed for downsampling
+        sql_query = '''SELECT t.id, t.name, t.start_time, p.latitude, p.longitude, {0}, b.latitudes, b.longitudes,
+                               {1}, c.latitudes, c.longitudes
+                        FROM tracks t
+                        LEFT JOIN {2}
+                        LEFT JOIN points p ON p.track_id = t.id AND c.track_id IS NULL
+                        LEFT JOIN track_blobs b ON b.track_id = t.id AND c.track_id IS NULL
+                        WHERE {3}
+                        ORDER BY t.start_time, t.id, p.seq;
+        '''.format("p.epoch, p.segment" if resolution_s is not None else "NULL, NULL",
+                   "b.times" if resolution_s is not None else "NULL", cache_join, condition)
+        reduced_tracks = []
+        try:
+            cursor = self.connection.cursor()
+            with metrics.phase('query'):
+                cursor.execute(sql_query, cache_params + params)
+            # only reading the rows is timed as the query, the caller times its own work on the tracks. The rows are
+            # timed in chunks, timing each row would cost about as much as reading it.
+            chunks = metrics.timed_iter('query', iter(lambda: cursor.fetchmany(FETCH_CHUNK_ROWS), []))
+            timed_rows = chain.from_iterable(chunks)
+            for (track_id, track_name, start_time), rows in groupby(timed_rows, key=lambda row: row[:3]):
+                first = next(rows)
+                if first[10] is not None:
+                    points = list(zip(unpack_column(first[10]), unpack_column(first[11])))
+                else:
+                    if first[7] is not None:
+                        points = list(zip(unpack_column(first[7]), unpack_column(first[8])))
+                        if resolution_s is not None:
+                            epochs = unpack_column(first[9])
+                            segments = self.get_segment_numbers(track_id)
+                    elif first[3] is None:
+                        points = epochs = segments = []
+                    else:
+                        rows = [first] + list(rows)
+                        points = [(row[3], row[4]) for row in rows]
+                        if resolution_s is not None:
+                            epochs = [row[5] if row[5] is not None else float('nan') for row in rows]
+                            segments = [row[6] for row in rows]
+                    if resolution_s is not None:
+                        with metrics.phase('downsample'):
+                            points = downsample_by_time(points, epochs, segments, resolution_s)
+                        reduced_tracks.append((track_id, points))
+                    elif simplify_tolerance is not None:
+                        with metrics.phase('simplify'):
+                            points = simplify_track(points, simplify_tolerance, simplify_method)
+                        reduced_tracks.append((track_id, points))
+                if resolution_s is not None and simplify_tolerance is not None:
+                    with metrics.phase('simplify'):
+                        points = simplify_track(points, simplify_tolerance, simplify_method)
+                metrics.count('points', len(points))
+                yield track_name, start_time, points
+        except sqlite3.Error as e:
+            logger.error("Connection error - could not retrieve requested tracks: {}\n{}".format(e, sql_query))
+        if self.read_only:
+            return
+        # the cache is written only after the query has been read to the end
+        for track_id, points in reduced_tracks:
+            if resolution_s is not None:
+                self.store_downsampled(track_id, resolution_s, points, commit=False)
+            else:
+                self.store_simplified(track_id, simplify_method, simplify_tolerance, points, commit=False)
+        self.connection.commit()
+
+    def store_simplified(self, track_id: int, method: str, tolerance: float, points: list[(float, float)],
+                         commit: bool = True) -> None:
+        """
+        Cache the simplified geometry of a track
+        :param track_id: the id of the track
+        :param method: the simplification method used
+        :param tolerance: the tolerance in meters used
+        :param points: the simplified list of (lat, lon)
+        :param commit: commit after storing
+        """
+        self.connection.execute('''INSERT OR REPLACE INTO track_simplified
+                                   (track_id, method, tolerance, latitudes, longitudes) VALUES (?, ?, ?, ?, ?)''',
+                                (track_id, method, tolerance, pack_column(lat for lat, lon in points),
+                                 pack_column(lon for lat, lon in points)))
+        if commit:
+            self.connection.commit()
+
+    def precompute_simplified(self, tolerances: [float], method: str = 'douglas-peucker') -> int:
+        """
+        Simplify all tracks that are not yet in the cache for the given tolerances, e.g. one tolerance per zoom level
+        :param tolerances: tolerances in meters
+        :param method: the simplification method
+        :return: number of simplified geometries added to the cache
+        """
+        added = 0
+        for tolerance in tolerances:
+            missing = self.connection.execute('''SELECT t.id, t.name FROM tracks t WHERE t.point_count > 0
+                                                AND NOT EXISTS (SELECT 1 FROM track_simplified s WHERE
+                                                s.track_id = t.id AND s.method = ? AND s.tolerance = ?)''',
+                                              (method, tolerance)).fetchall()
+            with self.connection:
+                for track_id, track_name in missing:
+                    latitudes, longitudes = self.get_track_arrays(track_name)[:2]
+                    points = simplify_track(list(zip(latitudes, longitudes)), tolerance, method)
+                    self.store_simplified(track_id, method, tolerance, points, commit=False)
+                    added += 1
+        return added
+
+    def store_downsampled(self, track_id: int, interval_s: float, points: list[(float, float)],
+                          commit: bool = True) -> None:
+        """
+        Cache the geometry of a track downsampled by time
+        :param track_id: the id of the track
+        :param interval_s: the time bucket length in seconds used
+        :param points: the downsampled list of (lat, lon)
+        :param commit: commit after storing
+        """
+        self.connection.execute('''INSERT OR REPLACE INTO track_downsampled
+                                   (track_id, interval_s, latitudes, longitudes) VALUES (?, ?, ?, ?)''',
+                                (track_id, interval_s, pack_column(lat for lat, lon in points),
+                                 pack_column(lon for lat, lon in points)))
+        if commit:
+            self.connection.commit()
+
+    def precompute_downsampled(self, intervals: [float]) -> int:
+        """
+        Downsample all tracks that are not yet in the cache for the given time resolutions
+        :param intervals: time bucket lengths in seconds
+        :return: number of downsampled geometries added to the cache
+        """
+        added = 0
+        for interval_s in intervals:
+            missing = self.connection.execute('''SELECT t.id, t.name FROM tracks t WHERE t.point_count > 0
+                                                AND NOT EXISTS (SELECT 1 FROM track_downsampled d WHERE
+                                                d.track_id = t.id AND d.interval_s = ?)''',
+                                              (interval_s,)).fetchall()
+            with self.connection:
+                for track_id, track_name in missing:
+                    latitudes, longitudes, elevations, epochs = self.get_track_arrays(track_name)
+                    points = downsample_by_time(list(zip(latitudes, longitudes)), epochs,
+                                                self.get_segment_numbers(track_id), interval_s)
+                    self.store_downsampled(track_id, interval_s, points, commit=False)
+                    added += 1
+        return added
+
+    def get_segment_numbers(self, track_id: int) -> array:
+        """
+        Returns the segment number of each point of a track, regardless of how the track is stored
+        """
+        segments = array('i')
+        for segment, point_count in self.connection.execute('''SELECT segment, point_count FROM track_segments
+                                                              WHERE track_id = ? ORDER BY first_seq''',
+                                                           (track_id,)):
+            segments.extend(segment for _ in range(point_count))
+        return segments
+
+    def get_track_segments(self, track) -> list[dict]:
+        """
+        Returns the summaries of the segments of a track
+        :param track: the track name
+        :return: one dict per segment in track order with the segment number, first point sequence number, point
+        count, start and end time and the statistics named in TRACK_STATS_COLUMNS
+        """
+        cursor = self.connection.execute('''SELECT s.segment, s.first_seq, s.point_count, s.start_time, s.end_time, {}
+                                            FROM track_segments s JOIN tracks t ON t.id = s.track_id
+                                            WHERE t.name = ? ORDER BY s.first_seq'''
+                                         .format(", ".join("s." + name for name in TRACK_STATS_COLUMNS)), (track,))
+        names = ('segment', 'first_seq', 'point_count', 'start_time', 'end_time') + TRACK_STATS_COLUMNS
+        return [dict(zip(names, row)) for row in cursor]
+
     def get_track_points(self, track) -> list[(float, float)]:
-        sql_query = '''SELECT latitude, longitude FROM gpx_data 
-                        WHERE track_name = '{}' 
-                        ORDER BY date(time) ;
-        '''.format(track)
-        # print("sql query for points: {}".format(sql_query))
+        sql_query = '''SELECT latitude, longitude FROM points
+                        WHERE track_id = (SELECT id FROM tracks WHERE name = ?)
+                        ORDER BY seq;
+        '''
         try:
             cursor = self.connection.cursor()
-            cursor.execute(sql_query)
+            cursor.execute(sql_query, (track,))
             result = cursor.fetchall()
+            if not result:
+                packed = self.get_packed_track(track)
+                if packed is not None:
+                    return list(zip(packed[0], packed[1]))
             return result
         except sqlite3.Error as e:
-            print(e)
-            print("Connection error - could not retrieve requested points: {}".format(sql_query))
+            logger.error("Connection error - could not retrieve requested points: {}\n{}".format(e, sql_query))
 
         return []
 
+    def get_packed_track(self, track) -> tuple:
+        """
+        Read a packed track with a single row fetch
+        :param track: the track name
+        :return: zero-copy float64 views of latitudes, longitudes, elevations (NaN when missing) and epoch times
+        (NaN when missing), or None when the track is not stored packed
+        """
+        row = self.connection.execute('''SELECT b.latitudes, b.longitudes, b.elevations, b.times
+                                         FROM track_blobs b JOIN tracks t ON t.id = b.track_id
+                                         WHERE t.name = ?''', (track,)).fetchone()
+        if row is None:
+            return None
+        return tuple(unpack_column(blob) for blob in row)
+
+    def get_track_arrays(self, track) -> tuple:
+        """
+        Returns the points of a track as columns regardless of how the track is stored
+        :param track: the track name
+        :return: latitudes, longitudes, elevations (NaN when missing) and epoch times (NaN when missing)
+        """
+        packed = self.get_packed_track(track)
+        if packed is not None:
+            return packed
+        columns = (array('d'), array('d'), array('d'), array('d'))
+        rows = self.connection.execute('''SELECT latitude, longitude, elevation, time FROM points
+                                          WHERE track_id = (SELECT id FROM tracks WHERE name = ?)
+                                          ORDER BY seq''', (track,))
+        for lat, lon, ele, time_text in rows:
+            columns[0].append(lat)
+            columns[1].append(lon)
+            columns[2].append(ele if ele is not None else float('nan'))
+            columns[3].append(time_to_epoch(time_text))
+        return columns
+
+    def get_track_columns(self, track_id: int) -> tuple:
+        """
+        Returns the points of a track as typed columns regardless of how the track is stored. The stored epoch times
+        are used, so no time text is parsed.
+        :param track_id: the id of the track
+        :return: latitudes, longitudes, elevations (NaN when missing) and epoch times (NaN when missing) as float64
+        columns and the segment numbers as an int array
+        """
+        row = self.connection.execute('''SELECT latitudes, longitudes, elevations, times FROM track_blobs
+                                         WHERE track_id = ?''', (track_id,)).fetchone()
+        if row is not None:
+            return tuple(unpack_column(blob) for blob in row) + (self.get_segment_numbers(track_id),)
+        rows = self.connection.execute('''SELECT latitude, longitude, elevation, epoch, segment FROM points
+                                          WHERE track_id = ? ORDER BY seq''', (track_id,)).fetchall()
+        if not rows:
+            return array('d'), array('d'), array('d'), array('d'), array('i')
+        latitudes, longitudes, elevations, epochs, segments = zip(*rows)
+        nan = float('nan')
+        return (array('d', latitudes), array('d', longitudes),
+                array('d', (nan if ele is None else ele for ele in elevations)),
+                array('d', (nan if epoch is None else epoch for epoch in epochs)), array('i', segments))
+
     def get_track_start_date(self, track_name) -> str:
-        sql_query = '''SELECT time from gpx_data WHERE track_name = '{}' 
-                        ORDER BY date(time) LIMIT 1;'''.format(track_name)
+        sql_query = "SELECT start_time FROM tracks WHERE name = ?;"
         try:
             cursor = self.connection.cursor()
-            cursor.execute(sql_query)
-            result = cursor.fetchall()
-            return result
+            cursor.execute(sql_query, (track_name,))
+            result = cursor.fetchone()
+            return result[0] if result else ""
         except sqlite3.Error as e:
-            print(e)
-            print("Connection error - could not retrieve requested track's start date: {}".format(sql_query))
-        return ""
\ No newline at end of file
+            logger.error("Connection error - could not retrieve requested track's start date: {}\n{}".format(
+                e, sql_query))
+        return ""
@@ -1,7 +1,15 @@
+from __future__ import annotations
+
 import os
-import gpxpy
-import datetime
-from gpxpy.gpx import GPX
+import hashlib
+import logging
+from typing import TYPE_CHECKING, NamedTuple
+from gpx_reader import open_gpx_file, read_gpx_columns
+from instrumentation import metrics
+from track_stats import summarize_track
+
+if TYPE_CHECKING:
+    from gpxpy.gpx import GPX
 
 """
 This script is used to read in all GPX tracks from files and storing all tracks to a single database.
@@ -12,6 +20,143 @@ in this Github repository and discussion: https://gist.github.com/KonstantinosSy
 Tracks in DB are also added the activity type that is available in the file name of the tracks.
 """
 
+logger = logging.getLogger(__name__)
+
+TRACK_FILE_PREFIX = 'SportsTracker'
+TRACK_FILE_SUFFIXES = ('.gpx', '.gpx.gz')
+
+
+class TrackFile(NamedTuple):
+    """
+    A track file found by scan_track_files
+    """
+    path: str
+    track_name: str
+    activity: str
+    date: str
+    size: int
+    mtime_ns: int
+
+
+def parse_track_filename(filename: str) -> tuple:
+    """
+    Parse the activity, date and track id of a SportsTracker-<activity>-<date>-<track id>.gpx file name in one pass
+    :param filename: the file name, with or without a directory, also with a .gpx.gz ending
+    :return: tuple of activity, date in format %Y-%m-%d and track name, "NA" for the activity and date when they
+    are missing. The track name of a file name without a track id is the whole name without the ending, so that
+    files with the same activity do not get the same track name.
+    """
+    name = os.path.basename(filename)
+    for suffix in TRACK_FILE_SUFFIXES[::-1]:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    parts = name.split('-', 3)
+    if len(parts) < 4:
+        logger.warning("Unexpected filename format, file format should be "
+                       "SportsTracker-<activity>-<date>-<track name>.gpx: {}".format(filename))
+        parts.extend(["NA"] * (3 - len(parts)))
+        parts = parts[:3] + [name]
+    activity, date, track_name = parts[1:]
+    if len(date) == 8 and date.isdigit():
+        # slicing instead of strptime, this is done for every file of the archive
+        date = date[:4] + '-' + date[4:6] + '-' + date[6:]
+    elif date != "NA":
+        logger.warning("Unexpected date '{}' in filename {}".format(date, filename))
+        date = "NA"
+    return activity, date, track_name
+
+
+def scan_track_files(path: str, prefix: str = TRACK_FILE_PREFIX, suffixes: tuple = TRACK_FILE_SUFFIXES):
+    """
+    Find the track files in a directory and its subdirectories, e.g. an archive split into year and month
+    directories. Each directory is read once with os.scandir and each file is parsed once.
+    :param path: the directory to scan
+    :param prefix: only file names starting with this
+    :param suffixes: only file names ending with one of these
+    :return: iterator of TrackFile records, the paths are absolute. Files without the date and track id in the
+    name are skipped.
+    """
+    directories = [os.path.abspath(path)]
+    while directories:
+        directory = directories.pop()
+        subdirectories = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if entry.is_dir():
+                    subdirectories.append(entry.path)
+                elif name.startswith(prefix) and name.endswith(suffixes) and entry.is_file():
+                    if name.count('-') < 3:
+                        logger.warning("Skipping {}, file name should be "
+                                       "SportsTracker-<activity>-<date>-<track name>.gpx".format(entry.path))
+                        continue
+                    stat = entry.stat()
+                    activity, date, track_name = parse_track_filename(name)
+                    yield TrackFile(entry.path, track_name, activity, date, stat.st_size, stat.st_mtime_ns)
+        # subdirectories in name order, the first one is scanned next
+        directories.extend(sorted(subdirectories, reverse=True))
+
+
+def parse_track_file(filename: str) -> tuple:
+    """
+    Parse a SportsTracker GPX file into compact point columns. This is a module level function so that it can be
+    run in worker processes and its result pickled back to the process writing the DB. The track is summarized here
+    too, so that the point epochs and statistics are calculated in the workers and not by the single writer.
+    :param filename: the GPX file to parse, .gpx or .gpx.gz
+    :return: tuple of track name, activity, date, the point columns (latitudes, longitudes, elevations, times,
+    segment numbers) and the TrackSummary of the columns
+    """
+    activity, date, track_name = parse_track_filename(filename)
+    columns = read_gpx_columns(filename)
+    return track_name, activity, date, columns, summarize_track(*columns)
+
+
+def file_content_hash(filename: str) -> str:
+    """
+    Returns the SHA-256 hex digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_track_files(filenames: [str], workers: int = 1):
+    """
+    Parse GPX files in order, in a pool of worker processes when more than one worker is requested
+    :param filenames: the GPX files to parse
+    :param workers: number of worker processes
+    :return: iterator of parse_track_file results in the order of the filenames, with workers at most two files
+    per worker are parsed ahead of the consumer
+    """
+    if workers <= 1 or len(filenames) < 2:
+        for filename in filenames:
+            yield parse_track_file(filename)
+        return
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    executor = ProcessPoolExecutor(max_workers=workers)
+    # only a few files are submitted ahead of the consumer, so parsed tracks do not pile up in memory when the
+    # workers parse faster than the DB is written
+    pending = deque()
+    remaining = iter(filenames)
+    try:
+        for filename in remaining:
+            pending.append(executor.submit(parse_track_file, filename))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for filename in remaining:
+                pending.append(executor.submit(parse_track_file, filename))
+                break
+            yield result
+    finally:
+        # when the consumer stops early, e.g. on a failed insert, the files not yet started are not parsed
+        executor.shutdown(cancel_futures=True)
+
 
 class GPXFileHandling:
 
@@ -22,13 +167,14 @@ class GPXFileHandling:
         :param file_ending: the file extension to look for
         :return: a list of files found
         """
-        files = os.listdir(path)
-        files = [f for f in files if os.path.isfile(path + '/' + f)]  # remove any directories
+        with os.scandir(path) as entries:
+            # file type from the directory listing, no stat call per entry
+            files = [entry.name for entry in entries if entry.is_file()]
         # filter only files with ending
         if len(file_ending) > 0:
-            files = list(filter(lambda f: f.split('.')[1] == file_ending, files))
+            files = [f for f in files if f.endswith('.' + file_ending)]
         if len(file_name_starts_with) > 0:
-            files = list(filter(lambda f: f.startswith(file_name_starts_with), files))
+            files = [f for f in files if f.startswith(file_name_starts_with)]
 
         return files
 
@@ -38,13 +184,7 @@ class GPXFileHandling:
         :param filename: the file from which to extract activity type
         :return: activity type name
         """
-        try:
-            activity = filename.split('/')[-1].split('-')[1]
-            # print("Activity from filename:", activity)
-        except IndexError as e:
-            activity = "NA"
-            print("Unexpected filename format, file format should be SportsTracker-[activity]-....gpx\n\n{}".format(e))
-        return activity
+        return parse_track_filename(filename)[0]
 
     def date_from_filename(self, filename: str) -> str:
         """
@@ -52,12 +192,7 @@ class GPXFileHandling:
         :param filename: the filename to parse
         :return: date in format %Y-%M-%d
         """
-        try:
-            track_date = datetime.datetime.strptime(filename.split('/')[-1].split('-')[2], '%Y%m%d').strftime('%Y-%m-%d')
-        except IndexError as e:
-            track_date = "NA"
-            print("Unexpected filename format, file format should be SportsTracker-<activity>-<date>-<track name>.gpx\n\n{}".format(e))
-        return track_date
+        return parse_track_filename(filename)[1]
 
 
     def track_name_from_filename(self, filename: str) -> str:
@@ -66,8 +201,7 @@ class GPXFileHandling:
         :param filename: the SportsTracker exported track name
         :return: track name
         """
-        # print("filename '{}' has track name '{}'".format(filename, filename.split('-')[3].split('.')[0]))
-        return filename.split('/')[-1].split('.')[0].split('-')[3]
+        return parse_track_filename(filename)[2]
 
     def open_gpx(self, filename: str) -> GPX:
         """
@@ -75,29 +209,56 @@ class GPXFileHandling:
         :param filename: the file to be read
         :return: GPX object
         """
-        with open(filename, 'r') as gpx_file:
+        # gpxpy is slow to import and only needed here and as a fallback of the GPX reader
+        import gpxpy
+        with open_gpx_file(filename, 'r') as gpx_file:
             gpx = gpxpy.parse(gpx_file)
         return gpx
 
-    def store_track_files_to_db(self, path_to_track_files, db) -> None:
-        path_to_tracks = path_to_track_files
-
+    def store_track_files_to_db(self, path_to_track_files, db, batch_size: int = 200, workers: int = 1) -> None:
+        """
+        Store new and changed track files to the DB. Files found in the ingest manifest with the same size and
+        modification time are skipped without reading them, a changed file replaces its old track.
+        :param path_to_track_files: directory of the SportsTracker GPX files, subdirectories are included
+        :param db: the DBHandling to store to
+        :param batch_size: number of files stored in one DB transaction
+        :param workers: number of processes parsing the files
+        """
         # get all tracks files
-        track_files = self.get_file_listing(path_to_tracks, 'gpx', 'SportsTracker')
-        db_tracks = db.get_all_track_names()
-        new_tracks = []
-        existing_tracks = []
-        # get file track name, check if track name is already in DB
-        for f in track_files:
-            track_name = self.track_name_from_filename(path_to_tracks + f)
-            if track_name in db_tracks:
-                # already exists, do nothing
-                existing_tracks.append(track_name)
-                pass
+        with metrics.phase('list'):
+            track_files = list(scan_track_files(path_to_track_files))
+            manifest = db.get_ingest_manifest()
+        db_tracks = None
+        new_files = []
+        fingerprints = {}
+        unchanged_files = 0
+        for track_file in track_files:
+            filename = track_file.path
+            known = manifest.get(filename)
+            if known is not None and known[:2] == (track_file.size, track_file.mtime_ns):
+                unchanged_files += 1
+                continue
+            with metrics.phase('hash'):
+                content_hash = file_content_hash(filename)
+            track_name = track_file.track_name
+            if known is None:
+                if db_tracks is None:
+                    db_tracks = set(db.get_all_track_names())
+                # a track stored before the manifest existed is kept as it is
+                unchanged = track_name in db_tracks
+            else:
+                # only touched, same content
+                unchanged = known[2] == content_hash
+            if unchanged:
+                db.record_ingested_file(filename, track_file.size, track_file.mtime_ns, content_hash, track_name)
+                unchanged_files += 1
             else:
-                db.store_gpx_points(path_to_tracks + f)
-                new_tracks.append(track_name)
-        # print("tracks already in DB: \n'{}'".format(existing_tracks))
-        # print("new tracks to DB: \n{}".format(new_tracks))
-        print("stored {} new tracks to DB with {} already found in DB".format(len(new_tracks), len(existing_tracks)))
+                new_files.append(filename)
+                fingerprints[filename] = (track_file.size, track_file.mtime_ns, content_hash)
+                metrics.count('bytes', track_file.size)
+        db.connection.commit()
+        metrics.count('files_unchanged', unchanged_files)
+        db.bulk_store_gpx_files(new_files, batch_size, workers, fingerprints)
+        logger.info("stored {} new or changed tracks to DB with {} already found in DB".format(len(new_files),
+                                                                                               unchanged_files))
         return
@@ -0,0 +1,153 @@
+import datetime
+import gzip
+from array import array
+from xml.etree.ElementTree import iterparse, ParseError
+
+"""
+Fast GPX track point reader. The file is parsed incrementally and track point values are copied straight into
+compact columns, without building a gpxpy object per point. Processed points are dropped from the XML tree as soon
+as they are read, so memory use stays flat also for long multi-day tracks. Files the fast reader does not understand
+are read with gpxpy instead. Gzip compressed exports (.gpx.gz) are decompressed on the fly by both readers.
+"""
+
+
+class UnsupportedGPX(ValueError):
+    """
+    Raised by the fast reader for files it cannot read the same way gpxpy does
+    """
+
+
+def point_time(point) -> str:
+    """
+    Format the time of a gpxpy point the way it is stored to the DB
+    :param point: gpxpy track point
+    :return: the time as text or None when the point has no time
+    """
+    if point.time is None:
+        return None
+    return point.time.isoformat(' ')
+
+
+def points_to_columns(points, segment_numbers=None) -> tuple:
+    """
+    Copy gpxpy track points into compact columns
+    :param points: iterable of gpxpy track points
+    :param segment_numbers: iterable of the segment number of each point, all points are in segment 0 by default
+    :return: tuple of latitudes, longitudes, elevations (NaN when missing), times and segment numbers
+    """
+    latitudes = array('d')
+    longitudes = array('d')
+    elevations = array('d')
+    times = []
+    segments = array('i')
+    for point in points:
+        latitudes.append(point.latitude)
+        longitudes.append(point.longitude)
+        elevations.append(point.elevation if point.elevation is not None else float('nan'))
+        times.append(point_time(point))
+    if segment_numbers is None:
+        segments.extend(0 for _ in latitudes)
+    else:
+        segments.extend(segment_numbers)
+    return latitudes, longitudes, elevations, times, segments
+
+
+def gpx_time_to_text(time_text: str) -> str:
+    """
+    Convert a GPX time to the format point_time gives for the same gpxpy point
+    :param time_text: the time from the GPX file, e.g. 2021-02-15T15:57:00Z
+    :return: the time as stored to the DB, e.g. 2021-02-15 15:57:00+00:00
+    """
+    if len(time_text) == 20 and time_text[10] == 'T' and time_text[19] == 'Z':
+        # the common case of SportsTracker exports, no need to parse it
+        return time_text[:10] + ' ' + time_text[11:19] + '+00:00'
+    try:
+        point_datetime = datetime.datetime.fromisoformat(time_text)
+    except ValueError as e:
+        raise UnsupportedGPX("Unsupported time format '{}'".format(time_text)) from e
+    if point_datetime.tzinfo is None:
+        # gpxpy takes times without a time zone as UTC
+        point_datetime = point_datetime.replace(tzinfo=datetime.timezone.utc)
+    return point_datetime.isoformat(' ')
+
+
+def open_gpx_file(filename: str, mode: str = 'rb'):
+    """
+    Open a GPX file, decompressing it on the fly when the name ends with .gz
+    :param filename: the GPX file
+    :param mode: 'rb' for bytes or 'r' for text
+    :return: the opened file object
+    """
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt' if mode == 'r' else mode)
+    return open(filename, mode)
+
+
+def read_gpx_columns_fast(gpx_file) -> tuple:
+    """
+    Read the track points of a GPX file with incremental XML parsing
+    :param gpx_file: file name or binary file object of the GPX file
+    :return: tuple of latitudes, longitudes, elevations (NaN when missing), times and segment numbers
+    """
+    latitudes = array('d')
+    longitudes = array('d')
+    elevations = array('d')
+    times = []
+    segments = array('i')
+    nan = float('nan')
+    trkpt_tag = ele_tag = time_tag = trkseg_tag = None
+    segment = None
+    # segments are numbered over all tracks of the file in document order, as gpxpy lists them
+    segment_number = -1
+    for event, elem in iterparse(gpx_file, events=('start', 'end')):
+        if event == 'start':
+            if trkpt_tag is None:
+                # the first element is the root, its namespace is used for all GPX elements
+                namespace, _, name = elem.tag[1:].rpartition('}') if elem.tag[0] == '{' else ('', '', elem.tag)
+                if name != 'gpx':
+                    raise UnsupportedGPX("Root element is not gpx but '{}'".format(elem.tag))
+                prefix = '{' + namespace + '}' if namespace else ''
+                trkpt_tag, ele_tag, time_tag, trkseg_tag = (prefix + 'trkpt', prefix + 'ele', prefix + 'time',
+                                                            prefix + 'trkseg')
+            elif elem.tag == trkseg_tag:
+                segment = elem
+                segment_number += 1
+        elif elem.tag == trkpt_tag:
+            latitudes.append(float(elem.get('lat')))
+            longitudes.append(float(elem.get('lon')))
+            ele = elem.findtext(ele_tag)
+            elevations.append(float(ele) if ele else nan)
+            point_time_text = elem.findtext(time_tag)
+            times.append(gpx_time_to_text(point_time_text.strip()) if point_time_text else None)
+            segments.append(max(0, segment_number))
+            if segment is not None:
+                # drop the points read so far, the segment element is still open in the parser
+                segment.clear()
+    return latitudes, longitudes, elevations, times, segments
+
+
+def read_gpx_columns_gpxpy(filename: str) -> tuple:
+    """
+    Read the track points of a GPX file with gpxpy
+    :param filename: the GPX file
+    :return: tuple of latitudes, longitudes, elevations (NaN when missing), times and segment numbers
+    """
+    import gpxpy
+    with open_gpx_file(filename, 'r') as gpx_file:
+        gpx = gpxpy.parse(gpx_file)
+    segments = [segment for track in gpx.tracks for segment in track.segments]
+    return points_to_columns((point for segment in segments for point in segment.points),
+                             (number for number, segment in enumerate(segments) for _ in segment.points))
+
+
+def read_gpx_columns(filename: str) -> tuple:
+    """
+    Read the track points of a GPX file, with the fast reader when possible and gpxpy otherwise
+    :param filename: the GPX file
+    :return: tuple of latitudes, longitudes, elevations (NaN when missing), times and segment numbers
+    """
+    try:
+        with open_gpx_file(filename) as gpx_file:
+            return read_gpx_columns_fast(gpx_file)
+    except (ParseError, ValueError, TypeError):
+        return read_gpx_columns_gpxpy(filename)
@@ -0,0 +1,75 @@
+import math
+from collections import Counter
+
+"""
+Aggregation of track points into a grid of roughly square cells for drawing heatmaps of long periods. Only the cell
+counts are kept, so memory use and the size of the drawn map depend on the number of visited cells and not on the
+number of points or tracks.
+"""
+
+METERS_PER_DEGREE = 111195.0
+
+
+class HeatmapGrid:
+
+    def __init__(self, cell_size_m: float = 50.0):
+        """
+        :param cell_size_m: the width and height of a grid cell in meters
+        """
+        if not cell_size_m > 0:
+            raise ValueError("cell_size_m has to be above zero, got {}".format(cell_size_m))
+        self.cell_size_m = cell_size_m
+        self.lat_step = cell_size_m / METERS_PER_DEGREE
+        self.counts = Counter()
+        # longitude width of the cells of each grid row, cells get narrower in degrees towards the poles
+        self.row_lon_steps = {}
+
+    def lon_step(self, row: int) -> float:
+        step = self.row_lon_steps.get(row)
+        if step is None:
+            row_lat = (row + 0.5) * self.lat_step
+            step = self.lat_step / max(0.01, math.cos(math.radians(row_lat)))
+            self.row_lon_steps[row] = step
+        return step
+
+    def add_points(self, points: list[(float, float)]) -> None:
+        """
+        Count the points of a track to the grid cells
+        :param points: list of (lat, lon) tuples
+        """
+        lat_step = self.lat_step
+        counts = self.counts
+        floor = math.floor
+        for lat, lon in points:
+            row = floor(lat / lat_step)
+            counts[(row, floor(lon / self.lon_step(row)))] += 1
+
+    def cells(self) -> list[(float, float, int)]:
+        """
+        Returns the visited cells as (center lat, center lon, point count)
+        """
+        return [((row + 0.5) * self.lat_step, (col + 0.5) * self.lon_step(row), count)
+                for (row, col), count in self.counts.items()]
+
+    def weighted_cells(self) -> list[(float, float, float)]:
+        """
+        Returns the visited cells as (center lat, center lon, weight) with the weight scaled to 0..1 by the busiest
+        cell
+        """
+        if not self.counts:
+            return []
+        max_count = max(self.counts.values())
+        return [(lat, lon, count / max_count) for lat, lon, count in self.cells()]
+
+    def bounds(self) -> list[(float, float)]:
+        """
+        Returns the south west and north east corners of the visited cells, an empty list for an empty grid
+        """
+        if not self.counts:
+            return []
+        rows = [row for row, col in self.counts]
+        south = min(rows) * self.lat_step
+        north = (max(rows) + 1) * self.lat_step
+        west = min(col * self.lon_step(row) for row, col in self.counts)
+        east = max((col + 1) * self.lon_step(row) for row, col in self.counts)
+        return [(south, west), (north, east)]
@@ -0,0 +1,145 @@
+import json
+
+"""
+Compact HTML map output. Instead of one folium object with inline JavaScript per track, all track geometries are
+written as a single payload of polyline encoded (delta encoded, 5 decimals) strings that a small Leaflet script
+decodes in the browser. Tooltips, colors and info markers of the tracks are kept.
+"""
+
+LEAFLET_VERSION = '1.9.3'
+
+HTML_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@{leaflet}/dist/leaflet.css">
+<script src="https://cdn.jsdelivr.net/npm/leaflet@{leaflet}/dist/leaflet.js"></script>
+<style>html, body, #map {{ width: 100%; height: 100%; margin: 0; padding: 0; }}</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+var payload = {payload};
+function decode(encoded) {{
+    var points = [], index = 0, lat = 0, lon = 0;
+    while (index < encoded.length) {{
+        for (var i = 0; i < 2; i++) {{
+            var result = 0, shift = 0, byte;
+            do {{
+                byte = encoded.charCodeAt(index++) - 63;
+                result |= (byte & 0x1f) << shift;
+                shift += 5;
+            }} while (byte >= 0x20);
+            var delta = (result & 1) ? ~(result >> 1) : (result >> 1);
+            if (i === 0) {{ lat += delta; }} else {{ lon += delta; }}
+        }}
+        points.push([lat / 1e5, lon / 1e5]);
+    }}
+    return points;
+}}
+var map = L.map('map');
+L.tileLayer('https://tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
+    maxZoom: 19,
+    attribution: '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
+}}).addTo(map);
+payload.lines.forEach(function (line) {{
+    var polyline = L.polyline(decode(line.points), {{color: line.color}}).addTo(map);
+    if (line.tooltip) {{ polyline.bindTooltip(line.tooltip, {{sticky: true}}); }}
+}});
+payload.markers.forEach(function (marker) {{
+    L.marker([marker.lat, marker.lon]).bindPopup(marker.text).addTo(map);
+}});
+if (payload.bounds) {{ map.fitBounds(payload.bounds); }} else {{ map.setView([0, 0], 2); }}
+</script>
+</body>
+</html>
+'''
+
+
+def encode_number(value: int) -> str:
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def encode_polyline(points: list[(float, float)]) -> str:
+    """
+    Encode a track with the polyline algorithm: each coordinate rounded to 5 decimals and stored as the
+    difference to the previous point in a variable length base64 like format
+    :param points: list of (lat, lon) tuples
+    :return: the encoded track
+    """
+    encoded = []
+    previous_lat = previous_lon = 0
+    for lat, lon in points:
+        lat_e5 = round(lat * 1e5)
+        lon_e5 = round(lon * 1e5)
+        encoded.append(encode_number(lat_e5 - previous_lat))
+        encoded.append(encode_number(lon_e5 - previous_lon))
+        previous_lat, previous_lon = lat_e5, lon_e5
+    return ''.join(encoded)
+
+
+def decode_polyline(encoded: str) -> list[(float, float)]:
+    """
+    Decode a track encoded with encode_polyline
+    :param encoded: the encoded track
+    :return: list of (lat, lon) tuples
+    """
+    points = []
+    index = lat = lon = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            result = shift = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append((lat / 1e5, lon / 1e5))
+    return points
+
+
+class CompactMap:
+    """
+    Collects lines and markers like a folium.Map and writes them as one compact HTML page
+    """
+
+    def __init__(self):
+        self.lines = []
+        self.markers = []
+        self.bounds = None
+
+    def add_line(self, points: list[(float, float)], tooltip: str = "", color: str = 'blue') -> None:
+        self.lines.append({'points': encode_polyline(points), 'tooltip': tooltip, 'color': color})
+
+    def add_marker(self, lat: float, lon: float, text: str) -> None:
+        self.markers.append({'lat': round(lat, 5), 'lon': round(lon, 5), 'text': text})
+
+    def fit_bounds(self, bounds: list) -> None:
+        """
+        :param bounds: south west and north east corners as [[lat, lon], [lat, lon]]
+        """
+        self.bounds = [list(corner) for corner in bounds]
+
+    def to_html(self) -> str:
+        payload = json.dumps({'lines': self.lines, 'markers': self.markers, 'bounds': self.bounds},
+                             separators=(',', ':'))
+        # the payload is inside a script element
+        payload = payload.replace('</', '<\\/')
+        return HTML_TEMPLATE.format(leaflet=LEAFLET_VERSION, payload=payload)
+
+    def save(self, filename: str) -> None:
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(self.to_html())
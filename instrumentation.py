@@ -0,0 +1,166 @@
+import contextlib
+import logging
+import threading
+import time
+from collections import defaultdict
+
+"""
+Timing and counting of the phases of the commands. The time of a phase is exclusive: while a nested phase runs the
+enclosing one is paused, so the phase times of a run add up to its wall time. The report is logged at the end of a
+command, and a cProfile dump can be written for a closer look without patching the code.
+"""
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+class Metrics:
+
+    def __init__(self):
+        # phase name to seconds and to number of times entered
+        self.timers = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+        # phases are nested per thread, e.g. in the request threads of the map server
+        self.thread_state = threading.local()
+
+    @property
+    def running(self) -> list:
+        """
+        The phases running in this thread as [phase name, time the phase was last started or resumed]
+        """
+        if not hasattr(self.thread_state, 'running'):
+            self.thread_state.running = []
+        return self.thread_state.running
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Time the code in the with block as the named phase
+        :param name: the phase, e.g. parse, insert or render
+        """
+        running = self.running
+        now = time.perf_counter()
+        with self.lock:
+            if running:
+                parent = running[-1]
+                self.timers[parent[0]] += now - parent[1]
+            self.calls[name] += 1
+        running.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            name, started = running.pop()
+            with self.lock:
+                self.timers[name] += now - started
+            if running:
+                running[-1][1] = now
+
+    def timed_iter(self, name: str, iterable):
+        """
+        Iterate and time the producing of each item as the named phase, the loop body using the items is not included
+        :param name: the phase
+        :param iterable: e.g. a generator reading rows from the DB
+        """
+        # called once per row on the hottest paths, so the time is summed here and the lock is taken only once at the
+        # end instead of entering a phase for each item
+        iterator = iter(iterable)
+        running = self.running
+        perf_counter = time.perf_counter
+        total = 0.0
+        calls = 0
+        try:
+            while True:
+                started = perf_counter()
+                # on the stack while the item is produced, so that phases entered by the producer pause this one
+                entry = [name, started]
+                running.append(entry)
+                calls += 1
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    running.pop()
+                    now = perf_counter()
+                    total += now - entry[1]
+                    if running:
+                        # the enclosing phase is paused while the item is produced
+                        running[-1][1] += now - started
+                yield item
+        finally:
+            with self.lock:
+                self.timers[name] += total
+                self.calls[name] += calls
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Add to a counter, e.g. files, points or bytes
+        """
+        with self.lock:
+            self.counters[name] += value
+
+    def reset(self) -> None:
+        self.timers.clear()
+        self.calls.clear()
+        self.counters.clear()
+
+    def summary(self) -> dict:
+        """
+        Returns the phase times in seconds, the times each phase was entered and the counters
+        """
+        return {'phases': {name: {'seconds': seconds, 'calls': self.calls[name]}
+                           for name, seconds in self.timers.items()},
+                'counters': dict(self.counters)}
+
+    def report(self) -> None:
+        """
+        Log the phase times and counters
+        """
+        if self.timers:
+            logger.info("phases: {}".format(", ".join("{} {:.3f}s".format(name, seconds)
+                                                      for name, seconds in self.timers.items())))
+        if self.counters:
+            logger.info("counters: {}".format(", ".join("{} {}".format(name, value)
+                                                        for name, value in self.counters.items())))
+
+
+# the metrics of the running command
+metrics = Metrics()
+
+
+def setup_logging(level: str = 'INFO') -> None:
+    """
+    Configure the log output of the command line tool
+    :param level: name of the log level, e.g. DEBUG, INFO or WARNING
+    """
+    logging.basicConfig(level=getattr(logging, level.upper()), format=LOG_FORMAT)
+
+
+@contextlib.contextmanager
+def profiled(output_file: str = None, top: int = 25):
+    """
+    Run the with block under cProfile when an output file is given
+    :param output_file: where the profile is dumped, readable with pstats or snakeviz
+    :param top: number of functions with the highest cumulative time logged at debug level
+    """
+    if output_file is None:
+        yield
+        return
+    import cProfile
+    import io
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_file)
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(top)
+        logger.debug(stream.getvalue())
+        logger.info("profile written to {}".format(output_file))
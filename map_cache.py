@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+import shutil
+
+"""
+Cache of rendered map files. A map is stored under a key made of the parameters it was created with and a change
+token of the DB tracks it was made from, so storing or replacing a track in the mapped range gives a new key and the
+old file is never served again. The least recently used files are removed when the cache grows over its size limit.
+"""
+
+
+class MapCache:
+
+    def __init__(self, cache_dir: str, max_size_bytes: int = 200 * 1024 * 1024):
+        """
+        :param cache_dir: directory of the cached files, created when missing
+        :param max_size_bytes: the total size of cached files kept
+        """
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, params: dict, change_token: str) -> str:
+        """
+        Returns the cache key of a map
+        :param params: everything the map output depends on, JSON serializable
+        :param change_token: the change token of the DB tracks the map is made from
+        :return: hex digest used as the file name in the cache
+        """
+        content = json.dumps({'params': params, 'change_token': change_token}, sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + '.html')
+
+    def get(self, key: str, output_file: str) -> bool:
+        """
+        Copy a cached map to the output file
+        :param key: the cache key
+        :param output_file: where the map is copied to
+        :return: True when the map was found in the cache
+        """
+        cached = self.path(key)
+        try:
+            shutil.copyfile(cached, output_file)
+        except FileNotFoundError:
+            return False
+        # the modification time tells when the file was last used
+        os.utime(cached)
+        return True
+
+    def put(self, key: str, map_file: str) -> None:
+        """
+        Add a rendered map file to the cache and evict the least recently used files over the size limit
+        :param key: the cache key
+        :param map_file: the rendered map
+        """
+        cached = self.path(key)
+        temporary = cached + '.tmp'
+        shutil.copyfile(map_file, temporary)
+        # readers never see a partly written file
+        os.replace(temporary, cached)
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used files until the cache is within its size limit
+        :return: number of removed files
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.html'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total_size = sum(size for mtime, size, path in entries)
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            os.remove(path)
+            total_size -= size
+            removed += 1
+        return removed
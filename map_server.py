@@ -0,0 +1,319 @@
+import asyncio
+import contextlib
+import datetime
+import json
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from db_handling import DBHandling
+from html_writer import CompactMap
+from simplify import SIMPLIFY_METHODS
+
+"""
+HTTP server answering map requests from one long running process. The DB is read through a pool of read only
+connections and all DB and drawing work runs in a thread pool, so the event loop only parses requests and writes
+responses. Responses are cached in memory under the request and the change token of the selected tracks, so a
+repeated request of an unchanged range costs one small DB query.
+
+    GET /tracks.json?start=2023-01-01&end=2023-12-31&activity=Cycling&bbox=60.1,24.8,60.3,25.1&simplify=10
+    GET /map.html?start=2023-01-01&end=2023-12-31&activity=Cycling&near=60.17,24.94,500
+    GET /stats.json?start=2023-01-01&end=2023-12-31
+"""
+
+logger = logging.getLogger(__name__)
+
+STATUS_TEXTS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                500: 'Internal Server Error'}
+JSON_TYPE = 'application/json'
+# request bodies are read and dropped, larger ones are refused
+MAX_BODY_BYTES = 1 << 20
+HTML_TYPE = 'text/html; charset=utf-8'
+
+
+class BadRequest(ValueError):
+    """
+    Raised for query parameters that cannot be used, answered with status 400
+    """
+
+
+class ConnectionPool:
+    """
+    Read only DB connections shared by the request threads, each connection is used by one thread at a time
+    """
+
+    def __init__(self, db_filename: str, size: int = 4):
+        self.size = size
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put(DBHandling(db_filename, read_only=True))
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the with block, waits when all connections are in use
+        """
+        dbh = self.connections.get()
+        try:
+            yield dbh
+        finally:
+            self.connections.put(dbh)
+
+    def close(self) -> None:
+        for _ in range(self.size):
+            self.connections.get().close_connection()
+
+
+class ResponseCache:
+    """
+    Least recently used cache of response bodies
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            response = self.entries.get(key)
+            if response is not None:
+                self.entries.move_to_end(key)
+            return response
+
+    def put(self, key, response) -> None:
+        with self.lock:
+            self.entries[key] = response
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def query_value(params: dict, name: str) -> str:
+    """
+    Returns the last value of a query parameter or None when it is not given
+    """
+    values = params.get(name)
+    return values[-1] if values else None
+
+
+def parse_numbers(text: str, count: int, name: str) -> tuple:
+    """
+    Parse a comma separated query parameter of numbers, e.g. bbox=60.1,24.8,60.3,25.1
+    """
+    try:
+        values = tuple(float(v) for v in text.split(','))
+    except ValueError:
+        raise BadRequest("{} has to be {} comma separated numbers, got '{}'".format(name, count, text))
+    if len(values) != count:
+        raise BadRequest("{} has to be {} comma separated numbers, got '{}'".format(name, count, text))
+    return values
+
+
+def parse_date(text: str, name: str) -> str:
+    """
+    Check that a date query parameter is in format %Y-%m-%d, which the DB queries compare with
+    """
+    try:
+        datetime.datetime.strptime(text, '%Y-%m-%d')
+    except ValueError:
+        raise BadRequest("{} has to be a date in format YYYY-MM-DD, got '{}'".format(name, text))
+    # strptime accepts also months and days without the leading zero
+    if len(text) != 10:
+        raise BadRequest("{} has to be a date in format YYYY-MM-DD, got '{}'".format(name, text))
+    return text
+
+
+def parse_selection(params: dict) -> dict:
+    """
+    Returns the tracks selected by the query parameters start, end, activity, bbox, near, simplify,
+    simplify_method and resolution
+    """
+    selection = {name: query_value(params, name) for name in ('start', 'end', 'activity')}
+    for name in ('start', 'end'):
+        if selection[name] is not None:
+            parse_date(selection[name], name)
+    bbox = query_value(params, 'bbox')
+    near = query_value(params, 'near')
+    if bbox and near:
+        raise BadRequest("give either bbox or near, not both")
+    selection['bbox'] = parse_numbers(bbox, 4, 'bbox') if bbox else None
+    selection['near'] = parse_numbers(near, 3, 'near') if near else None
+    for name in ('simplify', 'resolution'):
+        value = query_value(params, name)
+        selection[name] = parse_numbers(value, 1, name)[0] if value else None
+        if selection[name] is not None and not selection[name] > 0:
+            raise BadRequest("{} has to be above zero, got '{}'".format(name, value))
+    selection['simplify_method'] = query_value(params, 'simplify_method') or 'douglas-peucker'
+    if selection['simplify_method'] not in SIMPLIFY_METHODS:
+        raise BadRequest("unknown simplify_method '{}'".format(selection['simplify_method']))
+    return selection
+
+
+class MapServer:
+
+    def __init__(self, db_filename: str, pool_size: int = 4, cache_entries: int = 256):
+        """
+        :param db_filename: the tracks DB, it has to be at the current schema version
+        :param pool_size: number of DB connections and of threads handling requests
+        :param cache_entries: number of responses kept in memory
+        """
+        self.pool = ConnectionPool(db_filename, pool_size)
+        self.cache = ResponseCache(cache_entries)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='map-server')
+        self.routes = {'/tracks.json': self.tracks_json, '/map.html': self.map_html, '/stats.json': self.stats_json}
+
+    def selected_tracks(self, dbh: DBHandling, selection: dict) -> tuple:
+        """
+        Returns an iterator of (track name, start time, list of (lat, lon)) of the selected tracks and the track ids
+        of an area selection (None without one)
+        """
+        track_ids = None
+        if selection['bbox'] or selection['near']:
+            track_ids = dbh.get_tracks_in_area(bbox=selection['bbox'], near=selection['near'],
+                                               start=selection['start'], end=selection['end'],
+                                               activity=selection['activity'])
+        rows = dbh.get_activity_track_points(selection['start'], selection['end'], selection['activity'],
+                                             selection['simplify'], selection['simplify_method'], track_ids,
+                                             selection['resolution'])
+        return rows, track_ids
+
+    def tracks_json(self, dbh: DBHandling, selection: dict) -> tuple:
+        rows, track_ids = self.selected_tracks(dbh, selection)
+        tracks = [{'name': track_name, 'start_time': start_time, 'points': [[lat, lon] for lat, lon in points]}
+                  for track_name, start_time, points in rows]
+        bounds = dbh.get_tracks_bounds(selection['start'], selection['end'], selection['activity'], track_ids)
+        return JSON_TYPE, json.dumps({'tracks': tracks, 'bounds': bounds}, separators=(',', ':')).encode('utf-8')
+
+    def map_html(self, dbh: DBHandling, selection: dict) -> tuple:
+        rows, track_ids = self.selected_tracks(dbh, selection)
+        track_map = CompactMap()
+        for track_name, start_time, points in rows:
+            if not points:
+                continue
+            track_map.add_line(points, selection['activity'] or "", 'green')
+            track_map.add_marker(points[0][0], points[0][1], start_time)
+        bounds = dbh.get_tracks_bounds(selection['start'], selection['end'], selection['activity'], track_ids)
+        if bounds:
+            track_map.fit_bounds(bounds)
+        return HTML_TYPE, track_map.to_html().encode('utf-8')
+
+    def stats_json(self, dbh: DBHandling, selection: dict) -> tuple:
+        summaries = dbh.get_period_stats(selection['start'], selection['end'], selection['activity'])
+        return JSON_TYPE, json.dumps(summaries, separators=(',', ':')).encode('utf-8')
+
+    def respond(self, path: str, query: str) -> tuple:
+        """
+        Answer one request, run in the thread pool
+        :param path: the request path, e.g. /map.html
+        :param query: the query string of the request
+        :return: status, content type and body
+        """
+        handler = self.routes.get(path)
+        if handler is None:
+            return 404, JSON_TYPE, json.dumps({'error': "no such path '{}'".format(path)}).encode('utf-8')
+        try:
+            selection = parse_selection(parse_qs(query))
+        except BadRequest as e:
+            return 400, JSON_TYPE, json.dumps({'error': str(e)}).encode('utf-8')
+        with self.pool.connection() as dbh:
+            change_token = dbh.get_change_token(selection['start'], selection['end'], selection['activity'])
+            key = (path, tuple(sorted(selection.items())), change_token)
+            response = self.cache.get(key)
+            if response is None:
+                response = handler(dbh, selection)
+                self.cache.put(key, response)
+        return (200,) + response
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Read requests from one client connection and write the responses, the connection is kept open for
+        further requests unless the client asks to close it
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = request.decode('latin-1').split('\r\n')
+                request_line = lines[0].split()
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if value:
+                        headers[name.strip().lower()] = value.strip()
+                if len(request_line) != 3:
+                    status, content_type, body = 400, JSON_TYPE, b'{"error":"malformed request line"}'
+                    method, keep_alive = 'GET', False
+                else:
+                    method, target, version = request_line
+                    connection_header = headers.get('connection', '').lower()
+                    keep_alive = connection_header == 'keep-alive' if version == 'HTTP/1.0' else \
+                        connection_header != 'close'
+                    body_error = None
+                    content_length = headers.get('content-length', '0')
+                    # isdigit alone accepts digits like '²' that int() does not
+                    if not (content_length.isascii() and content_length.isdigit()):
+                        body_error = 'invalid Content-Length'
+                    elif int(content_length) > MAX_BODY_BYTES:
+                        body_error = 'request body too large'
+                    elif int(content_length) > 0:
+                        # a request body is not used for anything
+                        try:
+                            await reader.readexactly(int(content_length))
+                        except asyncio.IncompleteReadError:
+                            body_error = 'request body shorter than Content-Length'
+                    if body_error is not None:
+                        # the rest of the request cannot be told apart from the next one
+                        status, content_type, body = 400, JSON_TYPE, json.dumps({'error': body_error}).encode('utf-8')
+                        keep_alive = False
+                    elif method not in ('GET', 'HEAD'):
+                        status, content_type, body = 405, JSON_TYPE, b'{"error":"only GET and HEAD are supported"}'
+                    else:
+                        url = urlsplit(target)
+                        started = time.perf_counter()
+                        try:
+                            status, content_type, body = await loop.run_in_executor(self.executor, self.respond,
+                                                                                   url.path, url.query)
+                        except Exception:
+                            logger.exception("failed to answer {}".format(target))
+                            status, content_type, body = 500, JSON_TYPE, b'{"error":"internal error"}'
+                        logger.debug("{} {} {} {:.1f} ms".format(method, target, status,
+                                                                 (time.perf_counter() - started) * 1000))
+                head = 'HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+                    status, STATUS_TEXTS[status], content_type, len(body), 'keep-alive' if keep_alive else 'close')
+                try:
+                    writer.write(head.encode('latin-1') + (b'' if method == 'HEAD' else body))
+                    await writer.drain()
+                except ConnectionError:
+                    break
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.Server:
+        """
+        Start listening, port 0 picks a free port
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info("serving maps on {}".format(", ".join("{}:{}".format(*s.getsockname()[:2])
+                                                          for s in server.sockets)))
+        return server
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080) -> None:
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        self.executor.shutdown()
+        self.pool.close()
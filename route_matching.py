@@ -0,0 +1,178 @@
+import logging
+import math
+from typing import NamedTuple
+
+from db_handling import DBHandling
+from instrumentation import metrics
+from simplify import project_to_meters, simplify_track
+
+"""
+Find the stored tracks that followed a route, e.g. a planned route from a GPX file. Candidates are picked by their
+bounding boxes from the R*Tree index, so the points of other tracks are never read. The simplified geometry of the
+candidates (cached in the DB) is then compared with the route and the tracks within the max distance are ranked by
+their distance from the route.
+
+Both lines are resampled to points spaced evenly along them and compared with a discrete metric:
+- frechet: discrete Fréchet distance, the track has to follow the route in the same direction from start to end
+- hausdorff: symmetric Hausdorff distance, every point of either line is close to the other line in any order
+Points are looked up from a grid of cells as large as the max distance, so pairs of points farther apart than that
+are never compared.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class RouteMatch(NamedTuple):
+    distance_m: float
+    track_name: str
+    activity: str
+    start_time: str
+
+
+def resample(xs: list[float], ys: list[float], spacing: float) -> list[(float, float)]:
+    """
+    Returns points spaced evenly along a line, including its first and last points
+    :param xs: x coordinates in meters
+    :param ys: y coordinates in meters
+    :param spacing: distance in meters between the points
+    """
+    points = [(xs[0], ys[0])]
+    # distance from the last resampled point along the line
+    covered = 0.0
+    for i in range(1, len(xs)):
+        dx, dy = xs[i] - xs[i - 1], ys[i] - ys[i - 1]
+        length = math.hypot(dx, dy)
+        position = spacing - covered
+        while position <= length:
+            points.append((xs[i - 1] + dx * position / length, ys[i - 1] + dy * position / length))
+            position += spacing
+        covered = length - (position - spacing)
+    if covered > 0:
+        points.append((xs[-1], ys[-1]))
+    return points
+
+
+def grid_index(points: list[(float, float)], cell: float) -> dict:
+    """
+    Returns a dict of grid cell to the (index, x, y) of the points in the cell
+    """
+    cells = {}
+    for i, (x, y) in enumerate(points):
+        cells.setdefault((math.floor(x / cell), math.floor(y / cell)), []).append((i, x, y))
+    return cells
+
+
+def near_points(cells: dict, cell: float, x: float, y: float, max_distance_sq: float) -> list[(int, float)]:
+    """
+    Returns the (index, squared distance) of the points of a grid within the max distance of a point, the cell size
+    has to be at least the max distance
+    """
+    cx, cy = math.floor(x / cell), math.floor(y / cell)
+    found = []
+    for nx in (cx - 1, cx, cx + 1):
+        for ny in (cy - 1, cy, cy + 1):
+            for i, px, py in cells.get((nx, ny), ()):
+                distance_sq = (px - x) * (px - x) + (py - y) * (py - y)
+                if distance_sq <= max_distance_sq:
+                    found.append((i, distance_sq))
+    return found
+
+
+def hausdorff_distance(a: list[(float, float)], b: list[(float, float)], max_distance: float) -> float:
+    """
+    Discrete symmetric Hausdorff distance of two lines of points in meters
+    :return: the distance, infinity when it is more than max_distance
+    """
+    max_distance_sq = max_distance * max_distance
+    result_sq = 0.0
+    for points, others in ((a, b), (b, a)):
+        cells = grid_index(others, max_distance)
+        for x, y in points:
+            near = near_points(cells, max_distance, x, y, max_distance_sq)
+            if not near:
+                return math.inf
+            result_sq = max(result_sq, min(distance_sq for i, distance_sq in near))
+    return math.sqrt(result_sq)
+
+
+def frechet_distance(a: list[(float, float)], b: list[(float, float)], max_distance: float) -> float:
+    """
+    Discrete Fréchet distance of two lines of points in meters. Only the pairs of points within the max distance
+    of each other can be on a coupling below it, so the dynamic programming table is kept sparse.
+    :return: the distance, infinity when it is more than max_distance
+    """
+    max_distance_sq = max_distance * max_distance
+    cells = grid_index(b, max_distance)
+    last = len(b) - 1
+    previous = {}
+    for i, (x, y) in enumerate(a):
+        current = {}
+        for j, distance_sq in sorted(near_points(cells, max_distance, x, y, max_distance_sq)):
+            if i == 0 and j == 0:
+                reachable = 0.0
+            else:
+                reachable = min(previous.get(j, math.inf), previous.get(j - 1, math.inf),
+                                current.get(j - 1, math.inf))
+            if reachable < math.inf:
+                current[j] = max(distance_sq, reachable)
+        if not current:
+            return math.inf
+        previous = current
+    return math.sqrt(previous[last]) if last in previous else math.inf
+
+
+MATCH_METRICS = {'frechet': frechet_distance, 'hausdorff': hausdorff_distance}
+
+
+def match_route(dbh: DBHandling, route: list[(float, float)], max_distance: float = 100.0, metric: str = 'frechet',
+                simplify_tolerance: float = 10.0, start: str = None, end: str = None, activity: str = None) \
+        -> list[RouteMatch]:
+    """
+    Find the stored tracks that followed a route
+    :param dbh: the DB of the tracks
+    :param route: list of (lat, lon) of the route
+    :param max_distance: max distance in meters of a matching track from the route
+    :param metric: 'frechet' or 'hausdorff'
+    :param simplify_tolerance: tolerance in meters of the simplified geometry compared
+    :param start: first date (included) in format %Y-%m-%d
+    :param end: last date (included) in format %Y-%m-%d
+    :param activity: the activity type, None for all activities
+    :return: the matching tracks, closest first
+    """
+    if metric not in MATCH_METRICS:
+        raise ValueError("unknown metric '{}', expected one of {}".format(metric, ", ".join(MATCH_METRICS)))
+    if not max_distance > 0:
+        raise ValueError("max_distance has to be above zero, got {}".format(max_distance))
+    if not simplify_tolerance > 0:
+        raise ValueError("simplify_tolerance has to be above zero, got {}".format(simplify_tolerance))
+    if not route:
+        return []
+    distance_function = MATCH_METRICS[metric]
+    route_bbox = (min(lat for lat, lon in route), min(lon for lat, lon in route),
+                  max(lat for lat, lon in route), max(lon for lat, lon in route))
+    # the distances are measured between points this far apart along the lines, an error of at most half of it
+    spacing = max_distance / 4
+    # the simplified route and tracks are up to the tolerance away from the original lines
+    candidates = dbh.get_tracks_with_bbox_near(route_bbox, max_distance + 2 * simplify_tolerance + spacing / 2,
+                                               start, end, activity)
+    logger.info("{} candidate tracks for the route".format(len(candidates)))
+    if not candidates:
+        return []
+    activities = {track_name: track_activity for track_id, track_name, track_activity, start_time in candidates}
+    lat0 = route[0][0]
+    with metrics.phase('simplify'):
+        route_points = resample(*project_to_meters(simplify_track(route, simplify_tolerance), lat0), spacing)
+    matches = []
+    for track_name, start_time, points in dbh.get_activity_track_points(
+            start, end, activity, simplify_tolerance, track_ids=[candidate[0] for candidate in candidates]):
+        if not points:
+            continue
+        with metrics.phase('match'):
+            distance = distance_function(route_points, resample(*project_to_meters(points, lat0), spacing),
+                                         max_distance)
+        metrics.count('tracks')
+        if distance <= max_distance:
+            matches.append(RouteMatch(distance, track_name, activities[track_name], start_time))
+    matches.sort()
+    logger.info("{} of {} candidate tracks follow the route".format(len(matches), len(candidates)))
+    return matches
@@ -0,0 +1,156 @@
+import heapq
+import math
+
+"""
+Track simplification used before tracks are drawn to a map. Points are projected to a local equirectangular plane in
+meters, which is accurate enough for the extent of a single track, and then simplified with Douglas-Peucker or
+Visvalingam-Whyatt using a tolerance given in meters. Tracks can also be downsampled by time, keeping one point per
+time bucket of each track segment.
+"""
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def project_to_meters(points: list[(float, float)], lat0: float = None) -> tuple[list[float], list[float]]:
+    """
+    Project (lat, lon) points to x and y coordinates in meters around the first point of the track
+    :param points: list of (lat, lon) tuples
+    :param lat0: latitude of the projection, the latitude of the first point when not given. Tracks compared with
+    each other have to be projected with the same latitude.
+    :return: lists of x and y coordinates
+    """
+    if lat0 is None:
+        lat0 = points[0][0]
+    scale_y = math.radians(EARTH_RADIUS_M)
+    scale_x = scale_y * math.cos(math.radians(lat0))
+    xs = [lon * scale_x for lat, lon in points]
+    ys = [lat * scale_y for lat, lon in points]
+    return xs, ys
+
+
+def douglas_peucker(points: list[(float, float)], tolerance: float) -> list[(float, float)]:
+    """
+    Simplify a track with the Douglas-Peucker algorithm
+    :param points: list of (lat, lon) tuples
+    :param tolerance: max distance in meters of a dropped point from the simplified line
+    :return: the kept points in track order, first and last points are always kept
+    """
+    if len(points) < 3 or tolerance <= 0:
+        return list(points)
+    xs, ys = project_to_meters(points)
+    keep = bytearray(len(points))
+    keep[0] = keep[-1] = 1
+    tolerance_sq = tolerance * tolerance
+    # iterative instead of recursive so that long tracks do not hit the recursion limit
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xs[first], ys[first]
+        dx, dy = xs[last] - ax, ys[last] - ay
+        segment_sq = dx * dx + dy * dy
+        max_sq, index = -1.0, first
+        for i in range(first + 1, last):
+            px, py = xs[i] - ax, ys[i] - ay
+            if segment_sq > 0:
+                t = min(1.0, max(0.0, (px * dx + py * dy) / segment_sq))
+                px, py = px - t * dx, py - t * dy
+            distance_sq = px * px + py * py
+            if distance_sq > max_sq:
+                max_sq, index = distance_sq, i
+        if max_sq > tolerance_sq:
+            keep[index] = 1
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def visvalingam(points: list[(float, float)], tolerance: float) -> list[(float, float)]:
+    """
+    Simplify a track with the Visvalingam-Whyatt algorithm, removing points whose effective triangle area is
+    below the square of the tolerance
+    :param points: list of (lat, lon) tuples
+    :param tolerance: tolerance in meters, the area threshold is tolerance * tolerance
+    :return: the kept points in track order, first and last points are always kept
+    """
+    if len(points) < 3 or tolerance <= 0:
+        return list(points)
+    xs, ys = project_to_meters(points)
+    count = len(points)
+    previous = list(range(-1, count - 1))
+    following = list(range(1, count + 1))
+    removed = bytearray(count)
+
+    def area(i: int) -> float:
+        a, c = previous[i], following[i]
+        return abs((xs[a] - xs[i]) * (ys[c] - ys[i]) - (xs[c] - xs[i]) * (ys[a] - ys[i])) / 2
+
+    heap = [(area(i), i) for i in range(1, count - 1)]
+    heapq.heapify(heap)
+    threshold = tolerance * tolerance
+    current_area = {i: a for a, i in heap}
+    while heap:
+        point_area, i = heapq.heappop(heap)
+        if removed[i] or current_area[i] != point_area:
+            # stale heap entry of a point that has been removed or has a recomputed area
+            continue
+        if point_area >= threshold:
+            break
+        removed[i] = 1
+        a, c = previous[i], following[i]
+        following[a] = c
+        previous[c] = a
+        for neighbour in (a, c):
+            if 0 < neighbour < count - 1:
+                # the area of a neighbour never gets smaller than the area of the point just removed
+                current_area[neighbour] = max(area(neighbour), point_area)
+                heapq.heappush(heap, (current_area[neighbour], neighbour))
+    return [point for point, dropped in zip(points, removed) if not dropped]
+
+
+SIMPLIFY_METHODS = {'douglas-peucker': douglas_peucker, 'visvalingam': visvalingam}
+
+
+def simplify_track(points: list[(float, float)], tolerance: float, method: str = 'douglas-peucker') \
+        -> list[(float, float)]:
+    """
+    Simplify a track with the given method
+    :param points: list of (lat, lon) tuples
+    :param tolerance: tolerance in meters
+    :param method: 'douglas-peucker' or 'visvalingam'
+    :return: simplified list of (lat, lon) tuples
+    """
+    return SIMPLIFY_METHODS[method](points, tolerance)
+
+
+def downsample_by_time(points: list[(float, float)], epochs, segments, interval_s: float) -> list[(float, float)]:
+    """
+    Keep one point per time bucket of a track: the first point of each interval_s long bucket and the last point of
+    each segment. Buckets start from the first timed point of each segment, and points without a time are kept.
+    :param points: list of (lat, lon) tuples
+    :param epochs: point times as seconds since epoch, NaN when missing
+    :param segments: segment number of each point
+    :param interval_s: bucket length in seconds
+    :return: downsampled list of (lat, lon) tuples
+    """
+    if not interval_s > 0:
+        raise ValueError("interval_s has to be above zero, got {}".format(interval_s))
+    kept = []
+    count = len(points)
+    segment_start = None
+    last_bucket = None
+    for i, (point, epoch, segment) in enumerate(zip(points, epochs, segments)):
+        segment_ends = i == count - 1 or segments[i + 1] != segment
+        if epoch != epoch:
+            # NaN, nothing to bucket by
+            kept.append(point)
+        else:
+            if segment_start is None or segment_start[0] != segment:
+                segment_start = (segment, epoch)
+                last_bucket = None
+            bucket = math.floor((epoch - segment_start[1]) / interval_s)
+            if bucket != last_bucket or segment_ends:
+                kept.append(point)
+                last_bucket = bucket
+        if segment_ends:
+            segment_start = None
+    return kept
@@ -1,7 +1,9 @@
 import pytest
+import math
 
-from db_handling import DBHandling
+from db_handling import DBHandling, SCHEMA_VERSION, STORAGE_PACKED, tracks_filter
 import os
+from file_handling import parse_track_file
 
 
 def remove_db_file(dbfile):
@@ -14,8 +16,8 @@ def remove_db_file(dbfile):
 
 @pytest.fixture(autouse=True, scope='class')
 def setup(request):
-    request.cls.db_name = 'test.db'
-    remove_db_file(request.cls.db_name)
+    request.cls.db_filename = 'test.db'
+    remove_db_file(request.cls.db_filename)
 
 
 class TestDBHandling:
@@ -34,14 +36,16 @@ class TestDBHandling:
         cursor.execute(sql_query)
         results = cursor.fetchall()
         print(results)
+        assert (dbh.get_schema_version() == SCHEMA_VERSION)
         dbh.close_connection()
-        assert (len(results) == 2)
-        assert (('gpx_data',) in results)
+        assert (sorted(results) == [('ingest_manifest',), ('points',), ('track_blobs',), ('track_downsampled',),
+                                    ('track_segments',), ('track_simplified',), ('tracks',), ('tracks_rtree',), ('tracks_rtree_node',), ('tracks_rtree_parent',),
+                                    ('tracks_rtree_rowid',)])
 
     def test_insert_track_data(self):
         dbh = DBHandling(self.db_filename)
         dbh.create_gpx_table()
-        dbh.store_gpx_points('/Users/niko/Projects/sport-tracks/tests/data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx')
+        dbh.store_gpx_points('./data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx')
         sql_query = "SELECT COUNT(*) FROM gpx_data;"
         cursor = dbh.connection.cursor()
         cursor.execute(sql_query)
@@ -52,7 +56,208 @@ class TestDBHandling:
     def test_get_all_track_names(self):
         dbh = DBHandling(self.db_filename)
         dbh.create_gpx_table()
-        dbh.store_gpx_points(
-            '/Users/niko/Projects/sport-tracks/tests/data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx')
+        dbh.store_gpx_points('./data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx')
         tracks = dbh.get_all_track_names()
         assert (len(tracks) == 1)
+
+    def test_bulk_store_gpx_files(self, tmp_path):
+        dbh = DBHandling(str(tmp_path / 'bulk.db'))
+        dbh.set_import_pragmas()
+        dbh.create_gpx_table()
+        rows = dbh.bulk_store_gpx_files(['./data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'],
+                                        batch_size=1)
+        cursor = dbh.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM gpx_data;")
+        assert (rows == 897)
+        assert (cursor.fetchone()[0] == 897)
+        assert (dbh.get_all_track_names() == ['602ab25caee48f193dbea82a'])
+
+    def test_migrate_gpx_data_table(self, tmp_path):
+        dbh = DBHandling(str(tmp_path / 'v1.db'))
+        cursor = dbh.connection.cursor()
+        cursor.execute('''CREATE TABLE gpx_data (id INTEGER PRIMARY KEY AUTOINCREMENT, track_name TEXT, latitude REAL,
+                          longitude REAL, elevation REAL, time TEXT, activity_type TEXT)''')
+        cursor.executemany("INSERT INTO gpx_data (track_name, latitude, longitude, elevation, time, activity_type) "
+                           "VALUES (?, ?, ?, ?, ?, ?)",
+                           [('a', 60.2, 25.1, 10.0, '2023-06-06 10:00:00+00:00', 'Cycling'),
+                            ('a', 60.1, 25.0, 11.0, '2023-06-06 10:00:05+00:00', 'Cycling'),
+                            ('b', "", "", "", '2023-06-07', 'Running')])
+        dbh.connection.commit()
+        dbh.create_gpx_table()
+        cursor.execute("SELECT name, point_count, start_time, end_time, min_lat, max_lat FROM tracks ORDER BY name")
+        assert (cursor.fetchall() == [('a', 2, '2023-06-06 10:00:00+00:00', '2023-06-06 10:00:05+00:00', 60.1, 60.2),
+                                      ('b', 0, '2023-06-07', '2023-06-07', None, None)])
+        assert (dbh.get_track_points('a') == [(60.2, 25.1), (60.1, 25.0)])
+        assert (dbh.get_activity_tracks('2023-06-06', '2023-06-06', 'Cycling') == ['a'])
+        assert (dbh.get_activity_tracks('2023-06-07', '2023-06-08', 'Cycling') == [])
+        assert (dbh.get_track_start_date('a') == '2023-06-06 10:00:00+00:00')
+        cursor.execute("SELECT epoch, segment FROM points ORDER BY seq")
+        assert (cursor.fetchall() == [(1686045600.0, 0), (1686045605.0, 0)])
+        assert ([(s['segment'], s['point_count']) for s in dbh.get_track_segments('a')] == [(0, 2)])
+
+    def test_packed_storage(self, tmp_path):
+        track_file = './data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
+        rows_dbh = DBHandling(str(tmp_path / 'rows.db'))
+        rows_dbh.create_gpx_table()
+        rows_dbh.store_gpx_points(track_file)
+        dbh = DBHandling(str(tmp_path / 'packed.db'), STORAGE_PACKED)
+        dbh.create_gpx_table()
+        dbh.store_gpx_points(track_file)
+        track_name = '602ab25caee48f193dbea82a'
+        cursor = dbh.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM points;")
+        assert (cursor.fetchone()[0] == 0)
+        assert (dbh.get_track_points(track_name) == rows_dbh.get_track_points(track_name))
+        assert (dbh.get_track_start_date(track_name) == rows_dbh.get_track_start_date(track_name))
+        packed = dbh.get_track_arrays(track_name)
+        from_rows = rows_dbh.get_track_arrays(track_name)
+        assert (isinstance(packed[0], memoryview))
+        assert (len(packed[3]) == 897)
+        assert (packed[3][0] == from_rows[3][0] == 1613404620.0)
+        assert (list(packed[2]) == list(from_rows[2]))
+
+    def test_get_activity_track_points(self, tmp_path):
+        track_file = './data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
+        dbh = DBHandling(str(tmp_path / 'batch.db'))
+        dbh.create_gpx_table()
+        dbh.store_gpx_points(track_file)
+        dbh.insert_track_to('empty', 'AlpineSkiing', [], '2021-02-16')
+        packed_dbh = DBHandling(str(tmp_path / 'batch.db'), STORAGE_PACKED)
+        track_name, activity, track_date, columns, summary = parse_track_file(track_file)
+        packed_dbh.insert_track_columns('packed', activity, columns, track_date, summary=summary)
+        tracks = list(dbh.get_activity_track_points('2021-02-15', '2021-02-16', 'AlpineSkiing'))
+        names = [name for name, start_time, points in tracks]
+        assert (names == ['602ab25caee48f193dbea82a', 'packed', 'empty'])
+        assert (tracks[0][1] == dbh.get_track_start_date('602ab25caee48f193dbea82a'))
+        assert (tracks[0][2] == dbh.get_track_points('602ab25caee48f193dbea82a'))
+        assert (tracks[1][2] == tracks[0][2])
+        assert (tracks[2][2] == [])
+        assert (list(dbh.get_activity_track_points('2021-02-15', '2021-02-16', 'Cycling')) == [])
+        # the points are streamed in the order of an index, not sorted before the first track is read
+        for activity in ('AlpineSkiing', None):
+            condition, params = tracks_filter('2021-02-15', '2021-02-16', activity)
+            plan = dbh.connection.execute('''EXPLAIN QUERY PLAN SELECT p.latitude FROM tracks t
+                                             LEFT JOIN points p ON p.track_id = t.id WHERE {}
+                                             ORDER BY t.start_time, t.id, p.seq'''.format(condition), params)
+            assert (not [row for row in plan.fetchall() if 'TEMP B-TREE' in row[-1]])
+
+    def test_simplified_tracks_are_cached(self, tmp_path):
+        track_name = '602ab25caee48f193dbea82a'
+        dbh = DBHandling(str(tmp_path / 'simplified.db'))
+        dbh.create_gpx_table()
+        dbh.store_gpx_points('./data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx')
+        tracks = list(dbh.get_activity_track_points('2021-02-15', '2021-02-15', 'AlpineSkiing', 10.0))
+        assert (len(tracks[0][2]) < 897)
+        cursor = dbh.connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM track_simplified;")
+        assert (cursor.fetchone()[0] == 1)
+        # the second read comes from the cache
+        assert (list(dbh.get_activity_track_points('2021-02-15', '2021-02-15', 'AlpineSkiing', 10.0)) == tracks)
+        assert (dbh.precompute_simplified([10.0, 50.0]) == 1)
+        dbh.store_gpx_points('./data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx')
+        cursor.execute("SELECT COUNT(*) FROM track_simplified;")
+        assert (cursor.fetchone()[0] == 0)
+        assert (len(dbh.get_track_points(track_name)) == 897)
+
+    def test_segments_and_downsampling(self, tmp_path):
+        # two segments of one point every 10 seconds with a 10 minute pause between them
+        latitudes = [60.0 + i * 0.0001 for i in range(12)]
+        longitudes = [25.0] * 12
+        elevations = [10.0] * 12
+        times = ['2023-06-06 10:00:{:02d}+00:00'.format(i * 10) for i in range(6)] + \
+                ['2023-06-06 10:11:{:02d}+00:00'.format(i * 10) for i in range(6)]
+        segments = [0] * 6 + [1] * 6
+        columns = (latitudes, longitudes, elevations, times, segments)
+        dbh = DBHandling(str(tmp_path / 'segments.db'))
+        dbh.create_gpx_table()
+        dbh.insert_track_columns('rows', 'Running', columns)
+        packed_dbh = DBHandling(str(tmp_path / 'segments.db'), STORAGE_PACKED)
+        packed_dbh.insert_track_columns('packed', 'Running', columns)
+        summaries = dbh.get_track_segments('rows')
+        assert ([(s['segment'], s['first_seq'], s['point_count']) for s in summaries] == [(0, 0, 6), (1, 6, 6)])
+        assert (summaries[1]['start_time'] == '2023-06-06 10:11:00+00:00')
+        assert (summaries[0]['moving_time_s'] == 50.0)
+        assert (dbh.get_track_segments('packed') == summaries)
+        cursor = dbh.connection.cursor()
+        cursor.execute("SELECT segment, epoch FROM points WHERE seq = 6")
+        assert (cursor.fetchone() == (1, 1686046260.0))
+
+        tracks = list(dbh.get_activity_track_points('2023-06-06', '2023-06-06', 'Running', resolution_s=30))
+        # first point of each 30 s bucket and the last point of each segment
+        expected = [(latitudes[i], 25.0) for i in (0, 3, 5, 6, 9, 11)]
+        assert ([points for name, start_time, points in tracks] == [expected, expected])
+        cursor.execute("SELECT COUNT(*) FROM track_downsampled WHERE interval_s = 30")
+        assert (cursor.fetchone()[0] == 2)
+        assert (list(dbh.get_activity_track_points('2023-06-06', '2023-06-06', 'Running', resolution_s=30)) == tracks)
+        assert (dbh.precompute_downsampled([30, 60]) == 2)
+        dbh.insert_track_columns('rows', 'Running', columns[:4])
+        assert ([s['segment'] for s in dbh.get_track_segments('rows')] == [0])
+        cursor.execute("SELECT COUNT(*) FROM track_downsampled")
+        assert (cursor.fetchone()[0] == 2)
+
+    def test_get_track_columns(self, tmp_path):
+        nan = float('nan')
+        columns = ([60.0, 60.1, 60.2], [25.0, 25.1, 25.2], [10.0, nan, 12.0],
+                   ['2023-06-06 10:00:00+00:00', None, '2023-06-06 10:00:10+00:00'], [0, 0, 1])
+        dbh = DBHandling(str(tmp_path / 'columns.db'))
+        dbh.create_gpx_table()
+        dbh.insert_track_columns('rows', 'Running', columns)
+        packed_dbh = DBHandling(str(tmp_path / 'columns.db'), STORAGE_PACKED)
+        packed_dbh.insert_track_columns('packed', 'Cycling', columns, '2023-06-05')
+        dbh.insert_track_to('empty', 'Running', [], '2023-06-07')
+        tracks = dbh.get_tracks()
+        assert ([(name, activity) for track_id, name, activity, start_time in tracks] ==
+                [('packed', 'Cycling'), ('rows', 'Running')])
+        assert ([name for track_id, name, activity, start_time in dbh.get_tracks(activity='Running')] == ['rows'])
+        for track_id, name, activity, start_time in tracks:
+            latitudes, longitudes, elevations, epochs, segments = dbh.get_track_columns(track_id)
+            assert (list(latitudes) == columns[0])
+            assert (elevations[0] == 10.0 and math.isnan(elevations[1]))
+            assert (epochs[0] == 1686045600.0 and math.isnan(epochs[1]))
+            assert (list(segments) == [0, 0, 1])
+
+    def test_get_period_stats(self, tmp_path):
+        dbh = DBHandling(str(tmp_path / 'stats.db'))
+        dbh.create_gpx_table()
+        dbh.store_gpx_points('./data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx')
+        dbh.insert_track_to('empty', 'Running', [], '2021-02-15')
+        summaries = dbh.get_period_stats('2021-02-01', '2021-02-28')
+        assert ([s['activity'] for s in summaries] == ['AlpineSkiing', 'Running'])
+        assert (summaries[0]['tracks'] == 1)
+        assert (summaries[0]['distance_m'] > 1000)
+        assert (summaries[0]['avg_speed_mps'] > 0)
+        assert (summaries[1]['distance_m'] == 0.0)
+        assert (dbh.get_period_stats('2021-02-01', '2021-02-28', 'Running')[0]['tracks'] == 1)
+        assert (dbh.get_period_stats('2021-03-01', '2021-03-31') == [])
+
+    def test_get_tracks_in_area(self, tmp_path):
+        dbh = DBHandling(str(tmp_path / 'area.db'))
+        dbh.create_gpx_table()
+        dbh.store_gpx_points('./data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx')
+        track_id = dbh.connection.execute("SELECT id FROM tracks").fetchone()[0]
+        lat, lon = dbh.get_track_points('602ab25caee48f193dbea82a')[100]
+        assert (dbh.get_tracks_in_area(bbox=(lat - 0.0001, lon - 0.0001, lat + 0.0001, lon + 0.0001)) == [track_id])
+        assert (dbh.get_tracks_in_area(near=(lat, lon, 10.0), activity='AlpineSkiing') == [track_id])
+        assert (dbh.get_tracks_in_area(near=(lat, lon, 10.0), activity='Cycling') == [])
+        assert (dbh.get_tracks_in_area(near=(lat + 1.0, lon, 1000.0)) == [])
+        # inside the bounding box of the track but away from its points
+        min_lat, min_lon, max_lat, max_lon = dbh.connection.execute(
+            "SELECT min_lat, min_lon, max_lat, max_lon FROM tracks").fetchone()
+        assert (dbh.get_tracks_in_area(bbox=(min_lat, min_lon, min_lat + 1e-7, min_lon + 1e-7)) == [])
+        tracks = list(dbh.get_activity_track_points(None, None, None, track_ids=[track_id]))
+        assert (len(tracks) == 1 and len(tracks[0][2]) == 897)
+
+    def test_get_change_token(self, tmp_path):
+        track_file = './data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
+        dbh = DBHandling(str(tmp_path / 'token.db'))
+        dbh.create_gpx_table()
+        empty_token = dbh.get_change_token('2021-02-15', '2021-02-15', 'AlpineSkiing')
+        dbh.store_gpx_points(track_file)
+        token = dbh.get_change_token('2021-02-15', '2021-02-15', 'AlpineSkiing')
+        assert (token != empty_token)
+        # tracks outside the range do not change the token
+        dbh.insert_track_to('other', 'AlpineSkiing', [], '2021-03-01')
+        assert (dbh.get_change_token('2021-02-15', '2021-02-15', 'AlpineSkiing') == token)
+        # replacing a track in the range does
+        dbh.store_gpx_points(track_file)
+        assert (dbh.get_change_token('2021-02-15', '2021-02-15', 'AlpineSkiing') != token)
@@ -1,5 +1,11 @@
+import gzip
+import os
+import shutil
 import pytest
-from file_handling import GPXFileHandling
+from db_handling import DBHandling
+from file_handling import GPXFileHandling, parse_track_filename, parse_track_files, scan_track_files
+
+TRACK_FILE = 'SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
 
 
 class TestGPXFileHandling:
@@ -39,3 +45,98 @@ class TestGPXFileHandling:
         filename = '/Users/user/Projects/some-path/tests/data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
         track_name = fh.track_name_from_filename(filename)
         assert (track_name == expected)
+
+    def test_parse_track_files_in_workers(self):
+        filename = './data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
+        serial = list(parse_track_files([filename, filename]))
+        parallel = list(parse_track_files([filename, filename], workers=2))
+        assert (serial == parallel)
+        track_name, activity, track_date, (lats, lons, eles, times, segments), summary = parallel[0]
+        assert (track_name == '602ab25caee48f193dbea82a')
+        assert (activity == 'AlpineSkiing')
+        assert (track_date == '2021-02-15')
+        assert (len(lats) == len(lons) == len(eles) == len(times) == 897)
+        assert (times[0] == '2021-02-15 15:57:00+00:00')
+
+    def test_parse_track_files_submits_ahead_of_consumer(self, monkeypatch):
+        from concurrent.futures import ProcessPoolExecutor
+        submitted = []
+        submit = ProcessPoolExecutor.submit
+
+        def counting_submit(executor, function, *args):
+            submitted.append(args[0])
+            return submit(executor, function, *args)
+
+        monkeypatch.setattr(ProcessPoolExecutor, 'submit', counting_submit)
+        filename = './data/' + TRACK_FILE
+        parsed = parse_track_files([filename] * 20, workers=2)
+        assert (next(parsed)[0] == '602ab25caee48f193dbea82a')
+        assert (len(submitted) == 5)
+        # files not yet submitted are never parsed when the consumer stops
+        parsed.close()
+        assert (len(submitted) == 5)
+
+    def test_store_track_files_to_db_incrementally(self, tmp_path):
+        track_file = 'SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
+        tracks_path = tmp_path / 'tracks'
+        tracks_path.mkdir()
+        shutil.copy('./data/' + track_file, tracks_path / track_file)
+        fh = GPXFileHandling()
+        dbh = DBHandling(str(tmp_path / 'manifest.db'))
+        dbh.create_gpx_table()
+        fh.store_track_files_to_db(str(tracks_path) + '/', dbh)
+        manifest = dbh.get_ingest_manifest()
+        assert (list(manifest.keys()) == [os.path.abspath(tracks_path / track_file)])
+        assert (len(dbh.get_track_points('602ab25caee48f193dbea82a')) == 897)
+        # an unchanged file is not parsed again
+        dbh.connection.execute("DELETE FROM points WHERE seq > 0")
+        dbh.connection.commit()
+        fh.store_track_files_to_db(str(tracks_path) + '/', dbh)
+        assert (len(dbh.get_track_points('602ab25caee48f193dbea82a')) == 1)
+        # a changed file replaces the stored track
+        with open(tracks_path / track_file) as f:
+            content = f.read()
+        first_point_end = content.index('</trkpt>') + len('</trkpt>')
+        first_point_start = content.index('<trkpt')
+        with open(tracks_path / track_file, 'w') as f:
+            f.write(content[:first_point_start] + content[first_point_end:])
+        fh.store_track_files_to_db(str(tracks_path) + '/', dbh)
+        assert (len(dbh.get_track_points('602ab25caee48f193dbea82a')) == 896)
+        assert (dbh.get_ingest_manifest() != manifest)
+
+    def test_parse_track_filename(self):
+        assert (parse_track_filename('/a-b/2021/02/' + TRACK_FILE) ==
+                ('AlpineSkiing', '2021-02-15', '602ab25caee48f193dbea82a'))
+        assert (parse_track_filename(TRACK_FILE + '.gz') == ('AlpineSkiing', '2021-02-15', '602ab25caee48f193dbea82a'))
+        assert (parse_track_filename('SportsTracker-Running-20210215-a.b.gpx') == ('Running', '2021-02-15', 'a.b'))
+        assert (parse_track_filename('SportsTracker-Running.gpx') == ('Running', 'NA', 'SportsTracker-Running'))
+        assert (parse_track_filename('SportsTracker-Running-20210215.gpx.gz') ==
+                ('Running', '2021-02-15', 'SportsTracker-Running-20210215'))
+        assert (parse_track_filename('SportsTracker-Running-2021-x.gpx')[1] == 'NA')
+
+    def test_scan_track_files(self, tmp_path):
+        month_path = tmp_path / '2021' / '02'
+        month_path.mkdir(parents=True)
+        shutil.copy('./data/' + TRACK_FILE, tmp_path / TRACK_FILE)
+        with open('./data/' + TRACK_FILE, 'rb') as source, \
+                gzip.open(month_path / 'SportsTracker-Running-20210216-0123456789abcdef01234567.gpx.gz', 'wb') as f:
+            shutil.copyfileobj(source, f)
+        (month_path / 'SportsTracker-notes.txt').write_text('not a track')
+        (month_path / 'other.gpx').write_text('not a track')
+        # without a track id these would all get the same track name
+        shutil.copy('./data/' + TRACK_FILE, month_path / 'SportsTracker-Running.gpx')
+        shutil.copy('./data/' + TRACK_FILE, month_path / 'SportsTracker-Cycling.gpx')
+        track_files = list(scan_track_files(str(tmp_path)))
+        assert ([(t.track_name, t.activity, t.date) for t in track_files] ==
+                [('602ab25caee48f193dbea82a', 'AlpineSkiing', '2021-02-15'),
+                 ('0123456789abcdef01234567', 'Running', '2021-02-16')])
+        assert (track_files[0].path == os.path.abspath(tmp_path / TRACK_FILE))
+        assert (track_files[0].size == os.path.getsize('./data/' + TRACK_FILE))
+        assert (track_files[1].mtime_ns == os.stat(track_files[1].path).st_mtime_ns)
+
+        dbh = DBHandling(str(tmp_path / 'nested.db'))
+        dbh.create_gpx_table()
+        GPXFileHandling().store_track_files_to_db(str(tmp_path), dbh)
+        assert (dbh.get_track_points('0123456789abcdef01234567') == dbh.get_track_points('602ab25caee48f193dbea82a'))
+        assert (dbh.get_activity_tracks('2021-02-15', '2021-02-15', 'Running') == ['0123456789abcdef01234567'])
+        assert (sorted(dbh.get_all_track_names()) == ['0123456789abcdef01234567', '602ab25caee48f193dbea82a'])
@@ -0,0 +1,58 @@
+import gzip
+import math
+import pytest
+from xml.etree.ElementTree import ParseError
+from gpx_reader import read_gpx_columns, read_gpx_columns_fast, read_gpx_columns_gpxpy
+
+GPX_1_0 = '''<?xml version="1.0"?>
+<gpx version="1.0" creator="test" xmlns="http://www.topografix.com/GPX/1/0">
+<trk><trkseg>
+<trkpt lat="60.1" lon="25.1"><ele>10.5</ele><time>2023-06-06T10:00:00.250Z</time></trkpt>
+<trkpt lat="60.2" lon="25.2"><time>2023-06-06T12:00:00+02:00</time></trkpt>
+</trkseg><trkseg>
+<trkpt lat="60.3" lon="25.3"><ele>12</ele></trkpt>
+</trkseg></trk>
+<trk><trkseg><trkpt lat="60.4" lon="25.4"><ele>13</ele><time>2023-06-06T10:00:05</time></trkpt></trkseg></trk>
+</gpx>
+'''
+
+
+def assert_same_columns(fast, reference):
+    assert (list(fast[0]) == list(reference[0]))
+    assert (list(fast[1]) == list(reference[1]))
+    assert ([e if not math.isnan(e) else None for e in fast[2]] ==
+            [e if not math.isnan(e) else None for e in reference[2]])
+    assert (fast[3] == reference[3])
+    assert (list(fast[4]) == list(reference[4]))
+
+
+class TestGPXReader:
+
+    def test_parity_with_gpxpy(self):
+        filename = './data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
+        fast = read_gpx_columns_fast(filename)
+        assert (len(fast[0]) == 897)
+        assert_same_columns(fast, read_gpx_columns_gpxpy(filename))
+
+    def test_parity_with_gpxpy_gpx_1_0(self, tmp_path):
+        filename = str(tmp_path / 'route.gpx')
+        with open(filename, 'w') as f:
+            f.write(GPX_1_0)
+        fast = read_gpx_columns_fast(filename)
+        assert (len(fast[0]) == 4)
+        assert (list(fast[4]) == [0, 0, 1, 2])
+        assert_same_columns(fast, read_gpx_columns_gpxpy(filename))
+
+    def test_compressed_file(self, tmp_path):
+        filename = './data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
+        compressed = str(tmp_path / 'track.gpx.gz')
+        with open(filename, 'rb') as source, gzip.open(compressed, 'wb') as f:
+            f.write(source.read())
+        assert_same_columns(read_gpx_columns(compressed), read_gpx_columns(filename))
+        assert_same_columns(read_gpx_columns_gpxpy(compressed), read_gpx_columns(filename))
+
+    def test_not_a_gpx_file(self):
+        with pytest.raises(ParseError):
+            read_gpx_columns_fast('./data/dummy_file_SportsTracker.gpx')
+        with pytest.raises(Exception):
+            read_gpx_columns('./data/dummy_file_SportsTracker.gpx')
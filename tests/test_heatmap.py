@@ -0,0 +1,44 @@
+import math
+import pytest
+from heatmap import HeatmapGrid
+
+
+class TestHeatmapGrid:
+
+    def test_points_in_same_cell(self):
+        grid = HeatmapGrid(100.0)
+        grid.add_points([(60.00001, 25.00001), (60.00002, 25.00002)])
+        grid.add_points([(60.00003, 25.00003)])
+        cells = grid.cells()
+        assert (len(cells) == 1)
+        lat, lon, count = cells[0]
+        assert (count == 3)
+        assert (math.isclose(lat, 60.0, abs_tol=0.001))
+        assert (math.isclose(lon, 25.0, abs_tol=0.002))
+        assert (grid.weighted_cells()[0][2] == 1.0)
+
+    def test_cells_are_square_in_meters(self):
+        grid = HeatmapGrid(1000.0)
+        # about 2 km north and 2 km east of each other at latitude 60
+        grid.add_points([(60.0, 25.0), (60.018, 25.0), (60.0, 25.036)])
+        assert (len({row for row, col in grid.counts}) == 2)
+        assert (len(grid.cells()) == 3)
+        # about 200 m east, in the same 1 km cell unless on the cell border
+        grid = HeatmapGrid(1000.0)
+        grid.add_points([(60.0001, 25.0001), (60.0001, 25.0037)])
+        assert (len(grid.cells()) == 1)
+
+    def test_bounds(self):
+        grid = HeatmapGrid(50.0)
+        assert (grid.bounds() == [])
+        assert (grid.weighted_cells() == [])
+        grid.add_points([(60.1, 25.1), (60.2, 25.3), (60.2, 25.3)])
+        (south, west), (north, east) = grid.bounds()
+        assert (south <= 60.1 < 60.2 <= north)
+        assert (west <= 25.1 < 25.3 <= east)
+        assert (sorted(w for lat, lon, w in grid.weighted_cells()) == [0.5, 1.0])
+
+    def test_cell_size_above_zero(self):
+        for cell_size_m in (0.0, -50.0):
+            with pytest.raises(ValueError):
+                HeatmapGrid(cell_size_m)
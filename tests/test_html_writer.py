@@ -0,0 +1,33 @@
+import json
+from html_writer import CompactMap, decode_polyline, encode_polyline
+
+
+class TestHTMLWriter:
+
+    def test_encode_polyline(self):
+        # the example of the polyline algorithm documentation
+        points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        assert (encode_polyline(points) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        assert (decode_polyline(encode_polyline(points)) == points)
+        assert (encode_polyline([]) == '')
+
+    def test_round_trip_rounds_to_five_decimals(self):
+        points = [(60.396900123, 25.18267), (60.396882, 25.182675), (-33.8688, 151.20929)]
+        decoded = decode_polyline(encode_polyline(points))
+        assert (all(abs(a - b) <= 0.0000051 for p, d in zip(points, decoded) for a, b in zip(p, d)))
+
+    def test_compact_map_html(self, tmp_path):
+        compact_map = CompactMap()
+        compact_map.add_line([(60.1, 25.1), (60.2, 25.2)], "Cycling </script>", 'green')
+        compact_map.add_marker(60.1, 25.1, "2023-06-06 10:00:00+00:00")
+        compact_map.fit_bounds([[60.1, 25.1], [60.2, 25.2]])
+        filename = str(tmp_path / 'map.html')
+        compact_map.save(filename)
+        with open(filename) as f:
+            html = f.read()
+        assert (html.count('</script>') == 2)
+        payload = json.loads(html.split('var payload = ')[1].split(';\n')[0].replace('<\\/', '</'))
+        assert (decode_polyline(payload['lines'][0]['points']) == [(60.1, 25.1), (60.2, 25.2)])
+        assert (payload['lines'][0]['tooltip'] == "Cycling </script>")
+        assert (payload['markers'] == [{'lat': 60.1, 'lon': 25.1, 'text': "2023-06-06 10:00:00+00:00"}])
+        assert (payload['bounds'] == [[60.1, 25.1], [60.2, 25.2]])
@@ -0,0 +1,73 @@
+import os
+import time
+from instrumentation import Metrics, profiled
+
+
+class TestMetrics:
+
+    def test_nested_phase_pauses_enclosing_phase(self):
+        metrics = Metrics()
+        with metrics.phase('render'):
+            with metrics.phase('query'):
+                time.sleep(0.05)
+            time.sleep(0.01)
+        assert (metrics.timers['query'] >= 0.05)
+        assert (metrics.timers['render'] < 0.05)
+        assert (metrics.calls['render'] == 1)
+        assert (metrics.running == [])
+
+    def test_timed_iter_times_only_producing_items(self):
+        metrics = Metrics()
+
+        def slow_rows():
+            for i in range(3):
+                time.sleep(0.01)
+                yield i
+
+        with metrics.phase('render'):
+            items = []
+            for item in metrics.timed_iter('query', slow_rows()):
+                time.sleep(0.02)
+                items.append(item)
+        assert (items == [0, 1, 2])
+        assert (metrics.timers['query'] >= 0.03)
+        assert (metrics.timers['render'] >= 0.06)
+        assert (metrics.calls['query'] == 4)
+
+    def test_timed_iter_overhead(self):
+        metrics = Metrics()
+        items = range(100000)
+        started = time.perf_counter()
+        for _ in items:
+            pass
+        plain = time.perf_counter() - started
+        started = time.perf_counter()
+        with metrics.phase('render'):
+            for _ in metrics.timed_iter('query', items):
+                pass
+        timed = time.perf_counter() - started
+        # a few microseconds per item at most, it is used for every row read from the DB
+        assert (timed - plain < 100000 * 3e-6)
+        assert (metrics.calls['query'] == 100001)
+        assert (metrics.timers['query'] + metrics.timers['render'] <= timed)
+
+    def test_counters_and_summary(self):
+        metrics = Metrics()
+        metrics.count('files')
+        metrics.count('points', 100)
+        metrics.count('points', 50)
+        with metrics.phase('parse'):
+            pass
+        summary = metrics.summary()
+        assert (summary['counters'] == {'files': 1, 'points': 150})
+        assert (summary['phases']['parse']['calls'] == 1)
+        metrics.reset()
+        assert (metrics.summary() == {'phases': {}, 'counters': {}})
+
+    def test_profiled_writes_profile(self, tmp_path):
+        output_file = str(tmp_path / 'run.prof')
+        with profiled(output_file):
+            sum(range(1000))
+        assert (os.path.getsize(output_file) > 0)
+        with profiled(None):
+            pass
@@ -0,0 +1,47 @@
+import os
+from map_cache import MapCache
+
+
+def write_file(filename, content):
+    with open(filename, 'w') as f:
+        f.write(content)
+
+
+def read_file(filename):
+    with open(filename) as f:
+        return f.read()
+
+
+class TestMapCache:
+
+    def test_key(self, tmp_path):
+        cache = MapCache(str(tmp_path / 'cache'))
+        params = {'activity': 'Cycling', 'start_date': '2023-06-06', 'end_date': '2023-06-07'}
+        assert (cache.key(params, 'a') == cache.key(dict(reversed(list(params.items()))), 'a'))
+        assert (cache.key(params, 'a') != cache.key(params, 'b'))
+        assert (cache.key(params, 'a') != cache.key(dict(params, activity='Running'), 'a'))
+
+    def test_get_and_put(self, tmp_path):
+        cache = MapCache(str(tmp_path / 'cache'))
+        output_file = str(tmp_path / 'map.html')
+        assert (not cache.get('missing', output_file))
+        assert (not os.path.exists(output_file))
+        write_file(str(tmp_path / 'rendered.html'), '<html>map</html>')
+        cache.put('key', str(tmp_path / 'rendered.html'))
+        assert (cache.get('key', output_file))
+        assert (read_file(output_file) == '<html>map</html>')
+
+    def test_least_recently_used_are_evicted(self, tmp_path):
+        cache = MapCache(str(tmp_path / 'cache'), max_size_bytes=250)
+        rendered = str(tmp_path / 'rendered.html')
+        write_file(rendered, 'x' * 100)
+        cache.put('first', rendered)
+        cache.put('second', rendered)
+        os.utime(cache.path('first'), ns=(1, 1))
+        os.utime(cache.path('second'), ns=(2, 2))
+        # using the first map makes the second the least recently used one
+        assert (cache.get('first', str(tmp_path / 'map.html')))
+        cache.put('third', rendered)
+        assert (os.path.exists(cache.path('first')))
+        assert (not os.path.exists(cache.path('second')))
+        assert (os.path.exists(cache.path('third')))
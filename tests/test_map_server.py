@@ -0,0 +1,118 @@
+import asyncio
+import json
+import sqlite3
+import pytest
+
+from db_handling import DBHandling
+from map_server import MapServer, ResponseCache
+
+GPX_FILE = './data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
+
+
+@pytest.fixture
+def server(tmp_path):
+    db_filename = str(tmp_path / 'server.db')
+    dbh = DBHandling(db_filename)
+    dbh.create_gpx_table()
+    dbh.store_gpx_points(GPX_FILE)
+    dbh.close_connection()
+    server = MapServer(db_filename, pool_size=2, cache_entries=4)
+    yield server
+    server.close()
+
+
+class TestMapServer:
+
+    def test_tracks_json(self, server):
+        status, content_type, body = server.respond('/tracks.json', 'start=2021-02-15&end=2021-02-15'
+                                                                    '&activity=AlpineSkiing')
+        assert (status == 200)
+        assert (content_type == 'application/json')
+        response = json.loads(body)
+        assert (len(response['tracks']) == 1)
+        assert (response['tracks'][0]['name'] == '602ab25caee48f193dbea82a')
+        assert (len(response['tracks'][0]['points']) > 0)
+        assert (len(response['bounds']) == 2)
+        status, content_type, body = server.respond('/tracks.json', 'start=2021-02-16&end=2021-02-20')
+        assert (json.loads(body)['tracks'] == [])
+
+    def test_map_html_is_cached(self, server):
+        query = 'start=2021-02-15&end=2021-02-15&activity=AlpineSkiing&simplify=10'
+        status, content_type, body = server.respond('/map.html', query)
+        assert (status == 200)
+        assert (b'L.polyline' in body)
+        assert (len(server.cache.entries) == 1)
+        assert (server.respond('/map.html', query)[2] is body)
+
+    def test_bad_requests(self, server):
+        assert (server.respond('/tracks.json', 'bbox=1,2,3')[0] == 400)
+        assert (server.respond('/tracks.json', 'simplify_method=nope')[0] == 400)
+        assert (server.respond('/tracks.json', 'resolution=0')[0] == 400)
+        assert (server.respond('/tracks.json', 'resolution=-60')[0] == 400)
+        assert (server.respond('/map.html', 'simplify=0')[0] == 400)
+        assert (server.respond('/nothing', '')[0] == 404)
+        assert (server.respond('/tracks.json', 'start=bad')[0] == 400)
+        assert (server.respond('/tracks.json', 'start=2021-02-15&end=2021-2-15')[0] == 400)
+        assert (server.respond('/stats.json', 'end=2021-02-30')[0] == 400)
+
+    def test_pool_connections_are_read_only(self, server):
+        with server.pool.connection() as dbh:
+            with pytest.raises(sqlite3.OperationalError):
+                dbh.connection.execute("DELETE FROM tracks")
+
+    def test_http_requests(self, server):
+        async def request_twice():
+            listener = await server.start('127.0.0.1', 0)
+            host, port = listener.sockets[0].getsockname()[:2]
+            reader, writer = await asyncio.open_connection(host, port)
+            responses = []
+            for connection in ('keep-alive', 'close'):
+                writer.write('GET /stats.json?start=2021-01-01&end=2021-12-31 HTTP/1.1\r\nHost: test\r\n'
+                             'Connection: {}\r\n\r\n'.format(connection).encode('latin-1'))
+                head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+                length = int(head.lower().split('content-length:')[1].split('\r\n')[0])
+                responses.append((head.split('\r\n')[0], json.loads(await reader.readexactly(length))))
+            assert (await reader.read() == b'')
+            writer.close()
+            listener.close()
+            await listener.wait_closed()
+            return responses
+
+        responses = asyncio.run(request_twice())
+        assert ([status for status, body in responses] == ['HTTP/1.1 200 OK', 'HTTP/1.1 200 OK'])
+        assert (responses[0][1][0]['activity'] == 'AlpineSkiing')
+
+
+    def test_bad_content_length(self, server):
+        async def request(data: bytes, half_close: bool = False):
+            listener = await server.start('127.0.0.1', 0)
+            host, port = listener.sockets[0].getsockname()[:2]
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(data)
+            if half_close:
+                writer.write_eof()
+            response = await reader.read()
+            writer.close()
+            listener.close()
+            await listener.wait_closed()
+            return response.decode('latin-1')
+
+        for data, half_close in ((b'GET /stats.json HTTP/1.1\r\nContent-Length: abc\r\n\r\n', False),
+                                 (b'GET /stats.json HTTP/1.1\r\nContent-Length: -1\r\n\r\n', False),
+                                 (b'GET /stats.json HTTP/1.1\r\nContent-Length: \xb2\r\n\r\n', False),
+                                 (b'GET /stats.json HTTP/1.1\r\nContent-Length: 10\r\n\r\nabc', True)):
+            response = asyncio.run(request(data, half_close))
+            assert (response.startswith('HTTP/1.1 400 Bad Request'))
+            assert ('Connection: close' in response)
+
+
+class TestResponseCache:
+
+    def test_least_recently_used_is_dropped(self):
+        cache = ResponseCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        assert (cache.get('a') == 1)
+        cache.put('c', 3)
+        assert (cache.get('b') is None)
+        assert (cache.get('a') == 1 and cache.get('c') == 3)
@@ -0,0 +1,60 @@
+import math
+import pytest
+
+from db_handling import DBHandling
+from route_matching import frechet_distance, hausdorff_distance, match_route, resample
+
+GPX_FILE = './data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
+
+
+class TestRouteMatching:
+
+    def test_resample(self):
+        assert (resample([0.0, 10.0, 10.0], [0.0, 0.0, 5.0], 4.0) ==
+                [(0.0, 0.0), (4.0, 0.0), (8.0, 0.0), (10.0, 2.0), (10.0, 5.0)])
+        assert (resample([0.0, 8.0], [0.0, 0.0], 4.0) == [(0.0, 0.0), (4.0, 0.0), (8.0, 0.0)])
+        assert (resample([1.0], [2.0], 4.0) == [(1.0, 2.0)])
+
+    def test_distances(self):
+        line = [(float(x), 0.0) for x in range(0, 101, 10)]
+        shifted = [(x, 3.0) for x, y in line]
+        assert (hausdorff_distance(line, shifted, 10.0) == 3.0)
+        assert (frechet_distance(line, shifted, 10.0) == 3.0)
+        # the same points in the opposite direction
+        assert (hausdorff_distance(line, shifted[::-1], 10.0) == 3.0)
+        assert (frechet_distance(line, shifted[::-1], 10.0) == math.inf)
+        # a detour farther than the max distance
+        detour = line[:5] + [(40.0, 30.0)] + line[5:]
+        assert (hausdorff_distance(line, detour, 10.0) == math.inf)
+        assert (hausdorff_distance(line, detour, 40.0) == 30.0)
+        assert (frechet_distance(line, detour, 40.0) == 30.0)
+        assert (frechet_distance(line, line[:-2], 40.0) == 20.0)
+
+    def test_match_route(self, tmp_path):
+        dbh = DBHandling(str(tmp_path / 'match.db'))
+        dbh.create_gpx_table()
+        dbh.store_gpx_points(GPX_FILE)
+        dbh.insert_track_columns('elsewhere', 'AlpineSkiing', ([61.0, 61.01], [25.0, 25.01], [0.0, 0.0],
+                                                               ['2021-02-16 10:00:00', '2021-02-16 10:10:00']))
+        route = [(lat + 0.0002, lon) for lat, lon in dbh.get_track_points('602ab25caee48f193dbea82a')]
+        bbox = (min(lat for lat, lon in route), min(lon for lat, lon in route),
+                max(lat for lat, lon in route), max(lon for lat, lon in route))
+        assert ([name for track_id, name, activity, start_time in dbh.get_tracks_with_bbox_near(bbox, 50.0)] ==
+                ['602ab25caee48f193dbea82a'])
+        assert (dbh.get_tracks_with_bbox_near(bbox, 10.0) == [])
+
+        matches = match_route(dbh, route, max_distance=50.0)
+        assert ([(match.track_name, match.activity) for match in matches] ==
+                [('602ab25caee48f193dbea82a', 'AlpineSkiing')])
+        assert (20.0 < matches[0].distance_m < 30.0)
+        assert (match_route(dbh, route, max_distance=15.0) == [])
+        with pytest.raises(ValueError):
+            match_route(dbh, route, max_distance=0.0)
+        with pytest.raises(ValueError):
+            match_route(dbh, route, max_distance=50.0, simplify_tolerance=-5.0)
+        assert (match_route(dbh, route, max_distance=50.0, activity='Cycling') == [])
+        assert (match_route(dbh, route[::-1], max_distance=50.0) == [])
+        assert (len(match_route(dbh, route[::-1], max_distance=50.0, metric='hausdorff')) == 1)
+        # the compared geometry is kept in the simplified track cache
+        cursor = dbh.connection.execute("SELECT COUNT(*) FROM track_simplified")
+        assert (cursor.fetchone()[0] == 1)
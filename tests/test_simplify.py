@@ -0,0 +1,63 @@
+import pytest
+from file_handling import parse_track_file
+from simplify import douglas_peucker, downsample_by_time, visvalingam, simplify_track, project_to_meters
+
+
+def distance_to_line_m(point, line):
+    xs, ys = project_to_meters([line[0], point] + line)
+    px, py = xs[1], ys[1]
+    best = float('inf')
+    for i in range(2, len(xs) - 1):
+        ax, ay, bx, by = xs[i], ys[i], xs[i + 1], ys[i + 1]
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+        t = 0.0 if length_sq == 0 else min(1.0, max(0.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+        ex, ey = px - ax - t * dx, py - ay - t * dy
+        best = min(best, (ex * ex + ey * ey) ** 0.5)
+    return best
+
+
+class TestSimplify:
+
+    def track(self):
+        track_name, activity, track_date, (lats, lons, eles, times, segments), summary = parse_track_file(
+            './data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx')
+        return list(zip(lats, lons))
+
+    def test_straight_line(self):
+        line = [(60.0, 25.0 + i * 0.0001) for i in range(100)]
+        assert (douglas_peucker(line, 1.0) == [line[0], line[-1]])
+        assert (visvalingam(line, 1.0) == [line[0], line[-1]])
+
+    def test_short_tracks_are_not_changed(self):
+        assert (douglas_peucker([(60.0, 25.0), (60.1, 25.1)], 10.0) == [(60.0, 25.0), (60.1, 25.1)])
+        assert (simplify_track([], 10.0) == [])
+
+    def test_douglas_peucker_tolerance(self):
+        points = self.track()
+        simplified = douglas_peucker(points, 10.0)
+        assert (len(simplified) < len(points) / 2)
+        assert (simplified[0] == points[0] and simplified[-1] == points[-1])
+        assert (max(distance_to_line_m(point, simplified) for point in points) <= 10.0 + 1e-6)
+        assert (len(douglas_peucker(points, 50.0)) <= len(simplified))
+
+    def test_visvalingam_keeps_order(self):
+        points = self.track()
+        simplified = simplify_track(points, 10.0, 'visvalingam')
+        assert (3 <= len(simplified) < len(points))
+        indexes = [points.index(point) for point in simplified]
+        assert (indexes == sorted(indexes))
+
+    def test_downsample_by_time(self):
+        points = [(60.0 + i * 0.001, 25.0) for i in range(8)]
+        nan = float('nan')
+        epochs = [0, 5, 10, 25, 31, nan, 100, 104]
+        segments = [0, 0, 0, 0, 0, 0, 1, 1]
+        assert (downsample_by_time(points, epochs, segments, 10) ==
+                [points[0], points[2], points[3], points[4], points[5], points[6], points[7]])
+        # the last point of a segment is kept also when it has no time
+        assert (downsample_by_time(points, epochs, segments, 60) == [points[0], points[5], points[6], points[7]])
+        assert (downsample_by_time([], [], [], 10) == [])
+        for interval_s in (0, -10):
+            with pytest.raises(ValueError):
+                downsample_by_time(points, epochs, segments, interval_s)
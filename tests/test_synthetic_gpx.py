@@ -0,0 +1,27 @@
+import os
+from benchmarks.synthetic_gpx import generate_archive
+from file_handling import parse_track_file
+
+
+class TestSyntheticGPX:
+
+    def test_same_seed_gives_same_archive(self, tmp_path):
+        first = generate_archive(str(tmp_path / 'first'), files=3, points_per_track=20, seed=7)
+        second = generate_archive(str(tmp_path / 'second'), files=3, points_per_track=20, seed=7)
+        assert ([os.path.basename(f) for f in first] == [os.path.basename(f) for f in second])
+        for first_file, second_file in zip(first, second):
+            with open(first_file) as f1, open(second_file) as f2:
+                assert (f1.read() == f2.read())
+        other = generate_archive(str(tmp_path / 'other'), files=3, points_per_track=20, seed=8)
+        assert ([os.path.basename(f) for f in first] != [os.path.basename(f) for f in other])
+
+    def test_files_can_be_imported(self, tmp_path):
+        filenames = generate_archive(str(tmp_path), files=2, points_per_track=50, activities=['Running'],
+                                     start_date='2021-06-01', days=10)
+        for filename in filenames:
+            track_name, activity, date, columns, summary = parse_track_file(filename)
+            latitudes, longitudes, elevations, times, segments = columns
+            assert (activity == 'Running')
+            assert ('2021-06-01' <= date <= '2021-06-10')
+            assert (len(latitudes) == len(times) == 50)
+            assert (times[0] < times[-1])
@@ -0,0 +1,60 @@
+import os
+import pytest
+
+from db_handling import DBHandling, STORAGE_PACKED
+from file_handling import parse_track_file
+from track_export import export_tracks, read_tracks_export
+
+pytest.importorskip('pyarrow')
+pytest.importorskip('pandas')
+
+GPX_FILE = './data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx'
+
+
+@pytest.fixture
+def dbh(tmp_path):
+    dbh = DBHandling(str(tmp_path / 'export.db'))
+    dbh.create_gpx_table()
+    dbh.store_gpx_points(GPX_FILE)
+    track_name, activity, track_date, columns, summary = parse_track_file(GPX_FILE)
+    DBHandling(str(tmp_path / 'export.db'), STORAGE_PACKED).insert_track_columns('packed', 'Cycling Road', columns,
+                                                                                 track_date)
+    return dbh
+
+
+class TestTrackExport:
+
+    @pytest.mark.parametrize('export_format', ['parquet', 'arrow'])
+    def test_export_and_read(self, dbh, tmp_path, export_format):
+        output_dir = str(tmp_path / export_format)
+        assert (export_tracks(dbh, output_dir, export_format, chunk_points=500) == 2 * 897)
+        suffix = '.parquet' if export_format == 'parquet' else '.arrow'
+        assert (sorted(os.listdir(output_dir)) == ['activity=AlpineSkiing', 'activity=Cycling%20Road'])
+        assert (os.listdir(os.path.join(output_dir, 'activity=AlpineSkiing', 'year=2021')) == ['part-0' + suffix])
+
+        points = read_tracks_export(output_dir)
+        assert (len(points) == 2 * 897)
+        assert (str(points['latitude'].dtype) == 'float64')
+        assert (str(points['elevation'].dtype) == 'float32')
+        skiing = points[points['activity'] == 'AlpineSkiing']
+        assert (list(zip(skiing['latitude'], skiing['longitude'])) == dbh.get_track_points('602ab25caee48f193dbea82a'))
+        assert (skiing['time'].iloc[0].isoformat() == '2021-02-15T15:57:00+00:00')
+        assert (set(points['year']) == {2021})
+
+        cycling = read_tracks_export(output_dir, columns=['track_name', 'latitude'], activity='Cycling Road',
+                                     years=[2021])
+        assert (list(cycling.columns) == ['track_name', 'latitude'])
+        assert (set(cycling['track_name']) == {'packed'})
+        assert (list(cycling['latitude']) == list(skiing['latitude']))
+        assert (len(read_tracks_export(output_dir, years=[2020])) == 0)
+
+    def test_export_options(self, dbh, tmp_path):
+        output_dir = str(tmp_path / 'float32')
+        assert (export_tracks(dbh, output_dir, coordinate_type='float32', activity='Cycling Road') == 897)
+        points = read_tracks_export(output_dir)
+        assert (str(points['latitude'].dtype) == 'float32')
+        assert (set(points['activity']) == {'Cycling Road'})
+        with pytest.raises(ValueError):
+            export_tracks(dbh, output_dir)
+        with pytest.raises(ValueError):
+            export_tracks(dbh, str(tmp_path / 'csv'), 'csv')
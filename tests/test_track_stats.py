@@ -0,0 +1,54 @@
+import math
+from file_handling import parse_track_file
+from db_handling import time_to_epoch
+from track_stats import compute_track_stats, summarize_track
+
+
+class TestTrackStats:
+
+    def test_straight_line(self):
+        # 0.001 degrees of latitude is about 111 m, one point every 10 seconds
+        latitudes = [60.0, 60.001, 60.002, 60.002]
+        longitudes = [25.0, 25.0, 25.0, 25.0]
+        elevations = [10.0, 15.0, float('nan'), 12.0]
+        epochs = [0.0, 10.0, 20.0, 30.0]
+        stats = compute_track_stats(latitudes, longitudes, elevations, epochs)
+        assert (math.isclose(stats['distance_m'], 222.4, abs_tol=0.5))
+        # the last point did not move
+        assert (stats['moving_time_s'] == 20.0)
+        assert (math.isclose(stats['max_speed_mps'], 11.12, abs_tol=0.05))
+        assert (math.isclose(stats['avg_speed_mps'], stats['distance_m'] / 20.0))
+        assert (stats['min_elevation'] == 10.0)
+        assert (stats['max_elevation'] == 15.0)
+        assert (stats['ascent_m'] == 5.0)
+
+    def test_empty_track(self):
+        stats = compute_track_stats([], [], [], [])
+        assert (stats['distance_m'] == 0.0)
+        assert (stats['max_speed_mps'] is None)
+        assert (stats['avg_speed_mps'] is None)
+
+    def test_track_file(self):
+        track_name, activity, track_date, (lats, lons, eles, times, segments), summary = parse_track_file(
+            './data/SportsTracker-AlpineSkiing-20210215-602ab25caee48f193dbea82a.gpx')
+        stats = compute_track_stats(lats, lons, eles, [time_to_epoch(t) for t in times])
+        assert (stats['distance_m'] > 1000)
+        assert (0 < stats['moving_time_s'] <= time_to_epoch(times[-1]) - time_to_epoch(times[0]))
+        assert (stats['min_elevation'] == min(eles))
+        assert (stats['max_elevation'] == max(eles))
+        assert (summary.stats == stats)
+        assert (list(summary.epochs) == [time_to_epoch(t) for t in times])
+        assert ((summary.start_time, summary.end_time) == (times[0], times[-1]))
+
+    def test_summarize_segments(self):
+        summary = summarize_track([60.0, 60.001, 60.002, 60.003], [25.0, 25.0, 25.0, 25.0], [1.0, 2.0, 3.0, 4.0],
+                                  ['2021-02-15 10:00:00', None, '2021-02-15 10:05:00', '2021-02-15 10:06:00'],
+                                  [0, 0, 1, 1])
+        assert ([(s.segment, s.first_seq, s.point_count, s.start_time, s.end_time) for s in summary.segments] ==
+                [(0, 0, 2, '2021-02-15 10:00:00', '2021-02-15 10:00:00'),
+                 (1, 2, 2, '2021-02-15 10:05:00', '2021-02-15 10:06:00')])
+        assert (math.isnan(summary.epochs[1]))
+        assert ((summary.start_time, summary.end_time) == ('2021-02-15 10:00:00', '2021-02-15 10:06:00'))
+        assert (math.isclose(summary.segments[1].stats['distance_m'], 111.2, abs_tol=0.5))
+        empty = summarize_track([], [], [], [], [])
+        assert ((empty.start_time, empty.end_time, len(empty.epochs), empty.segments) == (None, None, 0, []))
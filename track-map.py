@@ -1,12 +1,24 @@
+from __future__ import annotations
+
+import os
 import sys
-import matplotlib.pyplot as plt
-import folium
 import argparse
-import pandas as pd
+import logging
+from typing import TYPE_CHECKING
 
-from gpxpy.gpx import GPX
 from file_handling import GPXFileHandling
 from db_handling import DBHandling
+from gpx_reader import read_gpx_columns
+from heatmap import HeatmapGrid
+from html_writer import CompactMap
+from instrumentation import metrics, profiled, setup_logging
+from map_cache import MapCache
+from simplify import simplify_track
+
+if TYPE_CHECKING:
+    from gpxpy.gpx import GPX
+
+logger = logging.getLogger('track-map')
 
 
 def get_gpx_lat_lon(gpx: GPX) -> tuple[list[float], list[float]]:
@@ -20,7 +32,11 @@ def get_gpx_lat_lon(gpx: GPX) -> tuple[list[float], list[float]]:
     return latitudes, longitudes
 
 
+# matplotlib and folium are imported in the functions using them, so that commands not drawing anything start fast
+
+
 def draw_track_points(latitudes: list[float], longitudes: list[float]) -> None:
+    import matplotlib.pyplot as plt
     # Create a simple plot using Matplotlib
     plt.plot(longitudes, latitudes, '-o')
     plt.xlabel('Longitude')
@@ -31,6 +47,7 @@ def draw_track_points(latitudes: list[float], longitudes: list[float]) -> None:
 
 
 def create_html_map(gpx: GPX) -> None:
+    import folium
     # Create a folium map centered around the first track point
     map_center = [gpx.tracks[0].segments[0].points[0].latitude, gpx.tracks[0].segments[0].points[0].longitude]
     my_map = folium.Map(location=map_center, zoom_start=12)
@@ -52,6 +69,7 @@ def draw_track_line(track: ([float], [float]), tooltip_comment: str = "") -> fol
     @param: tooltip_comment what should be tooltip for the track
     @return the newly created Folium map object
     """
+    import folium
     mid_point = int(len(track) / 2)
     center = [track[mid_point][0], track[mid_point][1]]
     my_map = folium.Map(location=center, zoom_start=15)
@@ -62,11 +80,31 @@ def draw_track_line(track: ([float], [float]), tooltip_comment: str = "") -> fol
 
 def add_line_to_map(track: ([float], float), track_map: folium.Map, new_color: str = 'green',
                     tooltip_comment: str = "") -> folium.Map:
+    if isinstance(track_map, CompactMap):
+        track_map.add_line(track, tooltip_comment, new_color)
+        return track_map
+    import folium
     folium.PolyLine(track, tooltip=tooltip_comment, color=new_color).add_to(track_map)
 
     return track_map
 
+def add_heatmap_to_map(grid: HeatmapGrid, track_map: folium.Map) -> folium.Map:
+    """
+    Draw the cells of a heatmap grid as a single heatmap layer
+    @param: grid the grid the track points have been added to
+    @param: track_map the map to draw to
+    @return the map
+    """
+    from folium.plugins import HeatMap
+    HeatMap(grid.weighted_cells(), min_opacity=0.3, radius=8, blur=6).add_to(track_map)
+    return track_map
+
+
 def add_info_marker_to_map(map: folium.Map, lat: float, lon:float, text: str) -> folium.Map:
+    if isinstance(map, CompactMap):
+        map.add_marker(lat, lon, text)
+        return map
+    import folium
     folium.Marker([lat, lon], popup=text).add_to(map)
     return map
 
@@ -79,29 +117,160 @@ def save_map_to_file(track_map: folium.map, filename: str = 'track_map.html'):
 def lists_to_tuple_list(lat: [float], lon: [float]) -> ([float], [float]):
     tuple_list: list[tuple[float, float]] = []
     if len(lat) != len(lon):
-        print("Longitude and latitude lists are of different sizes")
+        logger.error("Longitude and latitude lists are of different sizes")
         sys.exit(0)
     for i in range(len(lat)):
         tuple_list.append((lat[i], lon[i]))
     return tuple_list
 
 
-# Press the green button in the gutter to run the script.
-def fit_map(tracks_and_points, track_map):
-    data = {'Lat': [], 'Long': []}
-    for values in tracks_and_points.values():
-        for value in values:
-            data['Lat'].append(value[0])
-            data['Long'].append(value[1])
-    df = pd.DataFrame(data)
-    sw = df[['Lat', 'Long']].min().values.tolist()
-    ne = df[['Lat', 'Long']].max().values.tolist()
-    print("sw point", sw, "ne point", ne)
+def parse_float_list(text: str, count: int) -> tuple:
+    """
+    Parse a comma separated command line value of numbers
+    :param text: e.g. 60.1,24.9,500
+    :param count: the expected number of values
+    :return: tuple of floats
+    """
+    values = tuple(float(v) for v in text.split(','))
+    if len(values) != count:
+        logger.error("Expected {} comma separated numbers but got '{}'".format(count, text))
+        sys.exit(1)
+    return values
+
+
+def positive_float(text: str) -> float:
+    """
+    argparse type of options that have to be a number above zero, e.g. time resolutions
+    """
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("'{}' is not a number".format(text))
+    if not value > 0:
+        raise argparse.ArgumentTypeError("has to be above zero, got {}".format(text))
+    return value
+
+
+def print_period_stats(summary: dict) -> None:
+    """
+    Print one activity summary returned by DBHandling.get_period_stats
+    """
+    def value(name, scale=1.0, unit=''):
+        return "-" if summary[name] is None else "{:.1f}{}".format(summary[name] * scale, unit)
+
+    print("{}: {} tracks".format(summary['activity'], summary['tracks']))
+    print("  distance {}, moving time {}".format(value('distance_m', 0.001, ' km'),
+                                                 value('moving_time_s', 1 / 3600, ' h')))
+    print("  average speed {}, max speed {}".format(value('avg_speed_mps', 3.6, ' km/h'),
+                                                    value('max_speed_mps', 3.6, ' km/h')))
+    print("  elevation {} - {}, ascent {}".format(value('min_elevation', unit=' m'), value('max_elevation', unit=' m'),
+                                                  value('ascent_m', unit=' m')))
+
+
+def points_bounds(points: list[(float, float)]) -> list[(float, float)]:
+    """
+    Returns the south west and north east corners of a list of (lat, lon) points, an empty list for no points
+    """
+    if not points:
+        return []
+    return [(min(lat for lat, lon in points), min(lon for lat, lon in points)),
+            (max(lat for lat, lon in points), max(lon for lat, lon in points))]
+
+
+def fit_map(bounds: list[list[(float, float)]], track_map):
+    """
+    Fit the map view to the union of bounding boxes
+    @param: bounds list of [south west, north east] corners, empty ones are skipped
+    @param: track_map the folium or compact map
+    @return the map
+    """
+    corners = [corner for box in bounds for corner in box]
+    if not corners:
+        logger.warning("nothing to fit the map to")
+        return track_map
+    sw = [min(lat for lat, lon in corners), min(lon for lat, lon in corners)]
+    ne = [max(lat for lat, lon in corners), max(lon for lat, lon in corners)]
+    logger.debug("sw point {} ne point {}".format(sw, ne))
     track_map.fit_bounds([sw, ne])
 
     return track_map
 
 
+def render_map(args, dbh: DBHandling):
+    """
+    Draw the planned route and the tracks selected by the create_map arguments
+    @param: args the parsed create_map arguments
+    @param: dbh the DB to read the tracks from
+    @return the folium or compact map
+    """
+    start_date = args.start_date
+    end_date = args.end_date
+    activity = args.activity
+
+    # draw planned track points to map
+    if args.output_format == 'compact':
+        new_map = CompactMap()
+    else:
+        import folium
+        new_map = folium.Map()
+    map_bounds = []
+    if args.gpx_file:
+        lat, lon = read_gpx_columns(args.gpx_file)[:2]
+        latlon = lists_to_tuple_list(lat, lon)
+        if args.simplify:
+            latlon = simplify_track(latlon, args.simplify, args.simplify_method)
+        map_bounds.append(points_bounds(latlon))
+        # TODO, this activity needs to be passed as argument too
+        if isinstance(new_map, CompactMap):
+            new_map.add_line(latlon, "Planned route")
+        else:
+            new_map = draw_track_line(latlon, "Planned route")
+
+    track_ids = None
+    if args.bbox or args.near:
+        area = parse_float_list(args.bbox or args.near, 4 if args.bbox else 3)
+        if args.bbox:
+            track_ids = dbh.get_tracks_in_area(bbox=area, start=start_date, end=end_date, activity=activity)
+        else:
+            track_ids = dbh.get_tracks_in_area(near=area, start=start_date, end=end_date, activity=activity)
+    if args.mode == 'heatmap':
+        # all points are counted, simplifying would make straight stretches look less visited
+        grid = HeatmapGrid(args.heatmap_cell)
+        for track, track_start_date, latlon in dbh.get_activity_track_points(start_date, end_date, activity,
+                                                                             track_ids=track_ids,
+                                                                             resolution_s=args.resolution):
+            grid.add_points(latlon)
+        new_map = add_heatmap_to_map(grid, new_map)
+        map_bounds.append(grid.bounds())
+    else:
+        track_rows = dbh.get_activity_track_points(start_date, end_date, activity, args.simplify,
+                                                   args.simplify_method, track_ids, args.resolution)
+        for track, track_start_date, latlon in track_rows:
+            if not latlon:
+                continue
+            new_map = add_line_to_map(latlon, new_map, tooltip_comment=activity)
+            new_map = add_info_marker_to_map(new_map, latlon[0][0], latlon[0][1], track_start_date)
+        # the stored bounding boxes of the tracks, no need to go through the points again
+        map_bounds.append(dbh.get_tracks_bounds(start_date, end_date, activity, track_ids))
+
+    new_map = fit_map(map_bounds, new_map)
+
+    return new_map
+
+
+def map_cache_params(args) -> dict:
+    """
+    Returns the create_map arguments and input files a rendered map depends on, used as its cache key
+    """
+    params = {name: value for name, value in vars(args).items()
+              if name not in ('html_output', 'cache_dir', 'cache_size_mb', 'log_level', 'profile')}
+    params['db_file'] = os.path.abspath(args.db_file)
+    if args.gpx_file:
+        stat = os.stat(args.gpx_file)
+        params['gpx_file'] = (os.path.abspath(args.gpx_file), stat.st_size, stat.st_mtime_ns)
+    return params
+
+
 if __name__ == '__main__':
     # Create the main parser
     parser = argparse.ArgumentParser(description='Tool to read SportsTracker exported GPX files and draws these on map')
@@ -109,13 +278,39 @@ if __name__ == '__main__':
     # Create subparsers for different commands
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
 
+    # options of all commands
+    common_parser = argparse.ArgumentParser(add_help=False)
+    common_parser.add_argument('--log_level', '--log-level', default='INFO', type=str.upper,
+                               choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                               help='Level of the log messages, phase timings are logged at INFO')
+    common_parser.add_argument('--profile', type=str,
+                               help='Run the command under cProfile and write the profile to this file')
+
     # Define a command 'create-db' with its own set of arguments: read gpx files and store these to the DB
-    parser_create_db = subparsers.add_parser('create_db', help='Create or update a tracks DB based on provided GPX files')
+    parser_create_db = subparsers.add_parser('create_db', parents=[common_parser],
+                                             help='Create or update a tracks DB based on provided GPX files')
     parser_create_db.add_argument('--path_to_files', type=str, help='Path from where GPX files are to be read')
     parser_create_db.add_argument('--db_file', type=str, help='Name of the existing or new DB file to update or create')
+    parser_create_db.add_argument('--batch_size', type=int, default=200,
+                                  help='Number of GPX files stored in one DB transaction')
+    parser_create_db.add_argument('--storage', type=str, default='rows', choices=['rows', 'packed'],
+                                  help='Store new tracks one row per point or packed into one row per track')
+    parser_create_db.add_argument('--workers', type=int, default=1,
+                                  help='Number of processes parsing GPX files, the DB is written by one process')
+    parser_create_db.add_argument('--simplify_levels', type=positive_float, nargs='*', default=[],
+                                  help='Tolerances in meters for which simplified tracks are precomputed to the DB')
+    parser_create_db.add_argument('--downsample_levels', type=positive_float, nargs='*', default=[],
+                                  help='Time resolutions in seconds for which downsampled tracks are precomputed')
+    parser_create_db.add_argument('--journal_mode', type=str, default='WAL',
+                                  help='SQLite journal mode used for the import')
+    parser_create_db.add_argument('--synchronous', type=str, default='NORMAL',
+                                  help='SQLite synchronous level used for the import')
+    parser_create_db.add_argument('--cache_size', type=int, default=-65536,
+                                  help='SQLite page cache size used for the import, negative values are KiB')
 
     # Define a command 'command2' with its own set of arguments
-    parser_create_map = subparsers.add_parser('create_map', help='Create an HTML map from the tracks in the provided DB')
+    parser_create_map = subparsers.add_parser('create_map', parents=[common_parser],
+                                              help='Create an HTML map from the tracks in the provided DB')
     parser_create_map.add_argument('--db_file', type=str, help='DB filename to read the track information')
     # TODO single file name should be optional
     parser_create_map.add_argument('--gpx_file', type=str, help='A single GPX file to be included on a map')
@@ -125,57 +320,187 @@ if __name__ == '__main__':
     # TODO providing activity should be optional?
     parser_create_map.add_argument('--activity', type=str, help='Which activity is picked from the date range. If nothing '
                                                                 'provided, then first\'s track\'s activity is used')
+    parser_create_map.add_argument('--bbox', type=str,
+                                   help='Only tracks passing through the area min_lat,min_lon,max_lat,max_lon')
+    parser_create_map.add_argument('--near', type=str,
+                                   help='Only tracks passing within a radius of a location, given as lat,lon,radius_m')
+    parser_create_map.add_argument('--output_format', type=str, default='folium', choices=['folium', 'compact'],
+                                   help='Write the map with folium or as a compact page with all tracks in one '
+                                        'encoded payload')
+    parser_create_map.add_argument('--mode', type=str, default='lines', choices=['lines', 'heatmap'],
+                                   help='Draw each track as a line or all tracks as one heatmap layer')
+    parser_create_map.add_argument('--heatmap_cell', type=positive_float, default=50.0,
+                                   help='Size of the heatmap grid cells in meters')
+    parser_create_map.add_argument('--cache_dir', type=str,
+                                   help='Directory of rendered maps, a map made with the same parameters from '
+                                        'unchanged tracks is copied from there')
+    parser_create_map.add_argument('--cache_size_mb', type=int, default=200,
+                                   help='Size limit of the map cache, least recently used maps are removed first')
+    parser_create_map.add_argument('--simplify', type=positive_float,
+                                   help='Simplify tracks before drawing, the tolerance is given in meters')
+    parser_create_map.add_argument('--simplify_method', type=str, default='douglas-peucker',
+                                   choices=['douglas-peucker', 'visvalingam'], help='Track simplification algorithm')
+    parser_create_map.add_argument('--resolution', type=positive_float,
+                                   help='Draw one point per this many seconds of each track, e.g. 60 for maps of long '
+                                        'periods')
+
+    # Define a command 'stats': summaries of the stored track statistics over a period
+    parser_stats = subparsers.add_parser('stats', parents=[common_parser],
+                                         help='Show distance, speed and elevation statistics over a period')
+    parser_stats.add_argument('--db_file', type=str, help='DB filename to read the track information')
+    parser_stats.add_argument('--start_date', type=str, help='Start date (included) of the period')
+    parser_stats.add_argument('--end_date', type=str, help='End date (included) of the period')
+    parser_stats.add_argument('--activity', type=str, help='Activity to summarize, all activities if not provided')
+
+    # Define a command 'serve': answer map requests over HTTP from one long running process
+    parser_serve = subparsers.add_parser('serve', parents=[common_parser],
+                                         help='Serve maps and track geometry of the provided DB over HTTP')
+    parser_serve.add_argument('--db_file', type=str, help='DB filename to read the track information')
+    parser_serve.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser_serve.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser_serve.add_argument('--pool_size', type=int, default=4,
+                              help='Number of read only DB connections and of threads handling requests')
+    parser_serve.add_argument('--cache_entries', type=int, default=256,
+                              help='Number of responses kept in memory')
+
+    # Define a command 'export': columnar export of the track points for analytics
+    parser_export = subparsers.add_parser('export', parents=[common_parser],
+                                          help='Export the track points to Parquet or Arrow files partitioned by '
+                                               'activity and year')
+    parser_export.add_argument('--db_file', type=str, help='DB filename to read the track information')
+    parser_export.add_argument('--output_dir', type=str, help='Directory to write the export to, must be empty')
+    parser_export.add_argument('--format', type=str, default='parquet', choices=['parquet', 'arrow'],
+                               help='Parquet files or memory mappable Arrow IPC files')
+    parser_export.add_argument('--start_date', type=str, help='Start date (included) of the exported tracks')
+    parser_export.add_argument('--end_date', type=str, help='End date (included) of the exported tracks')
+    parser_export.add_argument('--activity', type=str, help='Activity to export, all activities if not provided')
+    parser_export.add_argument('--coordinate_type', type=str, default='float64', choices=['float64', 'float32'],
+                               help='Type of the latitude and longitude columns')
+    parser_export.add_argument('--chunk_points', type=int, default=1 << 20,
+                               help='Number of points buffered and written as one row group or record batch')
+
+    # Define a command 'match': find the stored tracks that followed a route
+    parser_match = subparsers.add_parser('match', parents=[common_parser],
+                                         help='Find the tracks in the provided DB that followed the route of a GPX '
+                                              'file')
+    parser_match.add_argument('--db_file', type=str, help='DB filename to read the track information')
+    parser_match.add_argument('--gpx_file', type=str, required=True, help='GPX file of the route, e.g. a planned route')
+    parser_match.add_argument('--start_date', type=str, help='Start date (included) of the searched tracks')
+    parser_match.add_argument('--end_date', type=str, help='End date (included) of the searched tracks')
+    parser_match.add_argument('--activity', type=str, help='Activity of the searched tracks, all if not provided')
+    parser_match.add_argument('--max_distance', type=positive_float, default=100.0,
+                              help='Max distance in meters of a matching track from the route')
+    parser_match.add_argument('--metric', type=str, default='frechet', choices=['frechet', 'hausdorff'],
+                              help='Frechet requires the route to be followed in the same direction, Hausdorff '
+                                   'accepts any order')
+    parser_match.add_argument('--simplify', type=positive_float, default=10.0,
+                              help='Tolerance in meters of the simplified geometry that is compared')
+    parser_match.add_argument('--limit', type=int, default=20, help='Number of best matches printed')
     # Parse the command-line arguments
     args = parser.parse_args()
 
+    setup_logging(getattr(args, 'log_level', 'INFO'))
+
     # Check which command was provided
-    if args.command == 'create_db':
-        print("Running create-db with params: {}".format(args))
-        db_name = args.db_file
-        path_to_tracks = args.path_to_files
-        # open and create db
-        dbh = DBHandling(db_name)
-        dbh.create_gpx_table()
-        # create or update db file
-        fh = GPXFileHandling()
-        fh.store_track_files_to_db(path_to_tracks + "/", dbh)
-
-    elif args.command == 'create_map':
-        print("Running create-map with params: {}".format(args))
-        db_name = args.db_file
-        single_file = args.gpx_file
-        start_date = args.start_date
-        end_date = args.end_date
-        output_file = args.html_output
-        activity = args.activity
-
-        # draw planned track points to map
-        new_map = folium.Map()
-        if single_file:
+    with profiled(getattr(args, 'profile', None)):
+        if args.command == 'create_db':
+            logger.debug("Running create-db with params: {}".format(args))
+            db_name = args.db_file
+            path_to_tracks = args.path_to_files
+            # open and create db
+            dbh = DBHandling(db_name, args.storage)
+            dbh.set_import_pragmas(args.journal_mode, args.synchronous, args.cache_size)
+            dbh.create_gpx_table()
+            # create or update db file
             fh = GPXFileHandling()
-            gpx_points = fh.open_gpx(single_file)
-            lat, lon = get_gpx_lat_lon(gpx_points)
-            latlon = lists_to_tuple_list(lat, lon)
-            # TODO, this activity needs to be passed as argument too
-            new_map = draw_track_line(latlon, "Planned route")
-
-        dbh = DBHandling(db_name)
-        tracks = dbh.get_activity_tracks(start_date, end_date, activity)
-        # print("tracks for {} between {} - {}\n{}".format(activity, start_date, end_date, tracks))
-        tracks_points = {}
-        for track in tracks:
-            # print("Getting points for track: {}".format(track))
-            latlon = dbh.get_track_points(track)
-            track_start_date = dbh.get_track_start_date(track)
-            tracks_points.update({track: latlon})
-            new_map = add_line_to_map(latlon, new_map, tooltip_comment=activity)
-            new_map = add_info_marker_to_map(new_map, latlon[0][0], latlon[0][1], track_start_date)
-
-        new_map = fit_map(tracks_points, new_map)
-        save_map_to_file(new_map, output_file)
-
-    else:
-        # Handle when no command is provided or an invalid command is given
-        print('Invalid command or no command provided.')
-
+            fh.store_track_files_to_db(path_to_tracks + "/", dbh, args.batch_size, args.workers)
+            if args.simplify_levels:
+                with metrics.phase('simplify'):
+                    dbh.precompute_simplified(args.simplify_levels)
+            if args.downsample_levels:
+                with metrics.phase('downsample'):
+                    dbh.precompute_downsampled(args.downsample_levels)
+
+        elif args.command == 'create_map':
+            logger.debug("Running create-map with params: {}".format(args))
+            db_name = args.db_file
+            start_date = args.start_date
+            end_date = args.end_date
+            output_file = args.html_output
+            activity = args.activity
+
+            if args.output_format == 'compact' and args.mode == 'heatmap':
+                parser_create_map.error("the compact output format draws lines only, it cannot be used with heatmap "
+                                        "mode")
+            dbh = DBHandling(db_name)
+            # bring a DB file created by an older version up to date
+            dbh.create_gpx_table()
+            map_cache = None
+            if args.cache_dir:
+                map_cache = MapCache(args.cache_dir, args.cache_size_mb * 1024 * 1024)
+                cache_key = map_cache.key(map_cache_params(args), dbh.get_change_token(start_date, end_date, activity))
+            if map_cache is not None and map_cache.get(cache_key, output_file):
+                logger.info("map found in cache: {}".format(output_file))
+            else:
+                # the DB reads done while drawing are timed as their own query phase
+                with metrics.phase('render'):
+                    new_map = render_map(args, dbh)
+                with metrics.phase('save'):
+                    save_map_to_file(new_map, output_file)
+                if map_cache is not None:
+                    map_cache.put(cache_key, output_file)
+
+        elif args.command == 'stats':
+            dbh = DBHandling(args.db_file)
+            dbh.create_gpx_table()
+            for summary in dbh.get_period_stats(args.start_date, args.end_date, args.activity):
+                print_period_stats(summary)
+
+        elif args.command == 'serve':
+            import asyncio
+            from map_server import MapServer
+            # the server only opens read only connections, bring the DB up to date first
+            dbh = DBHandling(args.db_file)
+            dbh.create_gpx_table()
+            dbh.close_connection()
+            server = MapServer(args.db_file, args.pool_size, args.cache_entries)
+            try:
+                asyncio.run(server.serve(args.host, args.port))
+            except KeyboardInterrupt:
+                logger.info("server stopped")
+            finally:
+                server.close()
+
+        elif args.command == 'export':
+            from track_export import export_tracks
+            try:
+                # pyarrow is imported only when the points are written, check for it before reading the DB
+                import pyarrow
+            except ImportError as e:
+                logger.error("export needs pyarrow, install it with pip install pyarrow: {}".format(e))
+                sys.exit(1)
+            dbh = DBHandling(args.db_file)
+            dbh.create_gpx_table()
+            try:
+                export_tracks(dbh, args.output_dir, args.format, args.start_date, args.end_date, args.activity,
+                              args.coordinate_type, args.chunk_points)
+            except ValueError as e:
+                parser_export.error(str(e))
+
+        elif args.command == 'match':
+            from route_matching import match_route
+            dbh = DBHandling(args.db_file)
+            dbh.create_gpx_table()
+            lat, lon = read_gpx_columns(args.gpx_file)[:2]
+            matches = match_route(dbh, lists_to_tuple_list(lat, lon), args.max_distance, args.metric, args.simplify,
+                                  args.start_date, args.end_date, args.activity)
+            for match in matches[:args.limit]:
+                print("{:8.1f} m  {}  {}  {}".format(match.distance_m, match.start_time, match.activity,
+                                                     match.track_name))
+
+        else:
+            # Handle when no command is provided or an invalid command is given
+            print('Invalid command or no command provided.')
+
+    metrics.report()
     sys.exit(0)
\ No newline at end of file
@@ -0,0 +1,226 @@
+import logging
+import os
+from urllib.parse import quote
+
+from db_handling import DBHandling
+from instrumentation import metrics
+
+"""
+Columnar export of the track points for analytics. Points are written one row per point with typed columns to Parquet
+or Arrow IPC files partitioned by activity and year in hive style directories, e.g.
+
+    export/activity=Cycling/year=2023/part-0.parquet
+
+Tracks are read from the DB one at a time and written in record batches of a bounded number of points, so the memory
+used does not depend on the size of the DB. The exported data set is read back to a pandas DataFrame with
+read_tracks_export, Arrow IPC files are memory mapped then.
+
+pyarrow is imported in the functions using it and pandas only by pyarrow when a DataFrame is made, so that the other
+commands do not need them.
+"""
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+COORDINATE_TYPES = ('float64', 'float32')
+# directory name pyarrow uses for a missing partition value
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+
+def export_schema(coordinate_type: str = 'float64'):
+    """
+    Returns the pyarrow schema of the exported points, the partition columns activity and year are in the
+    directory names
+    :param coordinate_type: 'float64' or 'float32' for the latitude and longitude columns
+    """
+    import pyarrow as pa
+    coordinate = pa.float32() if coordinate_type == 'float32' else pa.float64()
+    return pa.schema([('track_id', pa.int64()), ('track_name', pa.string()), ('segment', pa.int32()),
+                      ('time', pa.timestamp('ms', tz='UTC')), ('latitude', coordinate), ('longitude', coordinate),
+                      ('elevation', pa.float32())])
+
+
+def float64_array(values):
+    """
+    Zero-copy pyarrow float64 array of a float64 array or memoryview, NaN values become nulls
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    column = pa.Array.from_buffers(pa.float64(), len(values), [None, pa.py_buffer(values)])
+    if pc.any(pc.is_nan(column)).as_py():
+        column = pc.if_else(pc.is_nan(column), pa.scalar(None, pa.float64()), column)
+    return column
+
+
+def track_record_batch(schema, track_id: int, track_name: str, columns: tuple):
+    """
+    Build the record batch of the points of one track
+    :param schema: the schema returned by export_schema
+    :param track_id: the id of the track
+    :param track_name: the name of the track
+    :param columns: latitudes, longitudes, elevations, epochs and segments as returned by DBHandling.get_track_columns
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    latitudes, longitudes, elevations, epochs, segments = columns
+    count = len(latitudes)
+    milliseconds = pc.round(pc.multiply(float64_array(epochs), 1000.0))
+    return pa.record_batch([
+        pa.repeat(pa.scalar(track_id, pa.int64()), count),
+        pa.repeat(pa.scalar(track_name, pa.string()), count),
+        pa.Array.from_buffers(pa.int32(), count, [None, pa.py_buffer(segments)]),
+        pc.cast(milliseconds, pa.int64()).cast(schema.field('time').type),
+        float64_array(latitudes).cast(schema.field('latitude').type),
+        float64_array(longitudes).cast(schema.field('longitude').type),
+        float64_array(elevations).cast(pa.float32()),
+    ], schema=schema)
+
+
+def partition_path(output_dir: str, activity: str, year: str) -> str:
+    """
+    Returns the hive style directory of a partition, the values are URI encoded like pyarrow does
+    """
+    return os.path.join(output_dir, "activity={}".format(quote(activity, safe='') if activity else NULL_PARTITION),
+                        "year={}".format(year or NULL_PARTITION))
+
+
+class PartitionWriter:
+    """
+    Writes the record batches of one partition to a single file, buffering them to batches of chunk_points points
+    """
+
+    def __init__(self, path: str, schema, export_format: str, chunk_points: int):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.chunk_points = chunk_points
+        self.pending = []
+        self.pending_points = 0
+        if export_format == 'parquet':
+            self.writer = pq.ParquetWriter(path, schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(path, schema)
+
+    def write(self, batch) -> None:
+        self.pending.append(batch)
+        self.pending_points += batch.num_rows
+        if self.pending_points >= self.chunk_points:
+            self.flush()
+
+    def flush(self) -> None:
+        import pyarrow as pa
+        if not self.pending:
+            return
+        # one row group or IPC batch per chunk instead of one per track
+        table = pa.Table.from_batches(self.pending).combine_chunks()
+        self.writer.write_table(table, self.chunk_points)
+        self.pending = []
+        self.pending_points = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+
+
+def export_tracks(dbh: DBHandling, output_dir: str, export_format: str = 'parquet', start: str = None,
+                  end: str = None, activity: str = None, coordinate_type: str = 'float64',
+                  chunk_points: int = 1 << 20) -> int:
+    """
+    Export the points of the selected tracks partitioned by activity and start year of the track
+    :param dbh: the DB to export
+    :param output_dir: directory of the exported data set, it must not contain files
+    :param export_format: 'parquet' or 'arrow' for Arrow IPC files
+    :param start: first date (included) in format %Y-%m-%d, None for no limit
+    :param end: last date (included) in format %Y-%m-%d, None for no limit
+    :param activity: the activity type, None for all activities
+    :param coordinate_type: 'float64' or 'float32' for the latitude and longitude columns
+    :param chunk_points: max number of points held in memory and written as one row group or record batch
+    :return: number of exported points
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError("unknown export format '{}', expected one of {}".format(export_format,
+                                                                                ", ".join(EXPORT_FORMATS)))
+    if coordinate_type not in COORDINATE_TYPES:
+        raise ValueError("unknown coordinate type '{}', expected one of {}".format(coordinate_type,
+                                                                                  ", ".join(COORDINATE_TYPES)))
+    if os.path.isdir(output_dir) and os.listdir(output_dir):
+        raise ValueError("export directory '{}' is not empty".format(output_dir))
+    schema = export_schema(coordinate_type)
+    exported = 0
+    writer = None
+    partition = None
+    # the tracks come ordered by activity and start time, so only one partition is open at a time
+    for track_id, track_name, track_activity, start_time in dbh.get_tracks(start, end, activity):
+        track_partition = (track_activity, start_time[:4] if start_time else None)
+        if track_partition != partition:
+            if writer is not None:
+                with metrics.phase('save'):
+                    writer.close()
+            partition = track_partition
+            path = os.path.join(partition_path(output_dir, *partition), 'part-0' + EXPORT_FORMATS[export_format])
+            logger.debug("exporting {}".format(path))
+            writer = PartitionWriter(path, schema, export_format, chunk_points)
+        with metrics.phase('query'):
+            columns = dbh.get_track_columns(track_id)
+        with metrics.phase('save'):
+            writer.write(track_record_batch(schema, track_id, track_name, columns))
+        exported += len(columns[0])
+    if writer is not None:
+        with metrics.phase('save'):
+            writer.close()
+    metrics.count('points', exported)
+    logger.info("exported {} points to {}".format(exported, output_dir))
+    return exported
+
+
+def export_file_format(path: str) -> str:
+    """
+    Returns the format of an exported data set from the suffix of its first file
+    """
+    for directory, _, filenames in sorted(os.walk(path)):
+        for filename in sorted(filenames):
+            for export_format, suffix in EXPORT_FORMATS.items():
+                if filename.endswith(suffix):
+                    return export_format
+    raise ValueError("no exported track files in '{}'".format(path))
+
+
+def open_tracks_export(path: str, export_format: str = None):
+    """
+    Open an exported data set as a pyarrow dataset with the partition columns activity and year, for scanning
+    it in batches or with filters without reading all of it
+    :param path: the export directory
+    :param export_format: 'parquet' or 'arrow', detected from the file names when not given
+    """
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+    export_format = export_format or export_file_format(path)
+    return ds.dataset(os.path.abspath(path), format='ipc' if export_format == 'arrow' else 'parquet',
+                      partitioning='hive', filesystem=fs.LocalFileSystem(use_mmap=True))
+
+
+def read_tracks_export(path: str, columns: [str] = None, activity: str = None, years: [int] = None,
+                       export_format: str = None):
+    """
+    Read an exported data set to a pandas DataFrame. The files are memory mapped and only the partitions and
+    columns asked for are read.
+    :param path: the export directory
+    :param columns: the columns to read, all when not given
+    :param activity: only points of this activity
+    :param years: only points of tracks started in these years
+    :param export_format: 'parquet' or 'arrow', detected from the file names when not given
+    :return: pandas DataFrame with one row per point
+    """
+    import pyarrow.dataset as ds
+    dataset = open_tracks_export(path, export_format)
+    conditions = []
+    if activity is not None:
+        conditions.append(ds.field('activity') == activity)
+    if years is not None:
+        conditions.append(ds.field('year').isin(list(years)))
+    condition = None
+    for c in conditions:
+        condition = c if condition is None else condition & c
+    table = dataset.to_table(columns=columns, filter=condition)
+    # the arrow buffers are released while the DataFrame columns are made, so the data is not held twice
+    return table.to_pandas(split_blocks=True, self_destruct=True)
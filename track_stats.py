@@ -0,0 +1,156 @@
+import datetime
+import math
+from array import array
+from itertools import groupby
+from typing import NamedTuple
+
+"""
+Track statistics calculated from the point columns of a track in one pass. The statistics are calculated when a
+track is stored and kept on the track row, so that summaries over a period are plain SQL aggregates over the tracks
+table and never need to read the points.
+"""
+
+EARTH_RADIUS_M = 6371008.8
+# slower than this between two points is counted as standing still
+MOVING_SPEED_MPS = 0.5
+
+TRACK_STATS_COLUMNS = ('distance_m', 'moving_time_s', 'max_speed_mps', 'avg_speed_mps', 'min_elevation',
+                       'max_elevation', 'ascent_m')
+
+
+class SegmentSummary(NamedTuple):
+    segment: int
+    first_seq: int
+    point_count: int
+    start_time: str
+    end_time: str
+    stats: dict
+
+
+class TrackSummary(NamedTuple):
+    start_time: str
+    end_time: str
+    # point times as seconds since epoch, NaN when missing
+    epochs: array
+    stats: dict
+    segments: list[SegmentSummary]
+
+
+def time_to_epoch(time_text: str) -> float:
+    """
+    Convert a stored point time to seconds since epoch, times without a time zone are taken as UTC
+    :param time_text: the time as stored to the DB
+    :return: seconds since epoch or NaN when the point has no time
+    """
+    if not time_text:
+        return float('nan')
+    point_time = datetime.datetime.fromisoformat(time_text)
+    if point_time.tzinfo is None:
+        point_time = point_time.replace(tzinfo=datetime.timezone.utc)
+    return point_time.timestamp()
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great circle distance in meters between two points
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    h = (math.sin((phi2 - phi1) / 2) ** 2 +
+         math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(h)))
+
+
+def bbox_around(lat: float, lon: float, radius_m: float) -> tuple:
+    """
+    Returns a bounding box (min_lat, min_lon, max_lat, max_lon) containing all points within the radius
+    """
+    lat_delta = math.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = math.cos(math.radians(min(89.9, abs(lat) + lat_delta)))
+    lon_delta = min(180.0, lat_delta / cos_lat)
+    return lat - lat_delta, lon - lon_delta, lat + lat_delta, lon + lon_delta
+
+
+def compute_track_stats(latitudes, longitudes, elevations, epochs) -> dict:
+    """
+    Calculate distance, moving time, speeds and elevation statistics of a track
+    :param latitudes: latitudes of the points
+    :param longitudes: longitudes of the points
+    :param elevations: elevations of the points, NaN when missing
+    :param epochs: point times as seconds since epoch, NaN when missing
+    :return: dict with a value for each name in TRACK_STATS_COLUMNS, None when it cannot be calculated
+    """
+    distance = 0.0
+    moving_time = 0.0
+    moving_distance = 0.0
+    max_speed = None
+    min_elevation = None
+    max_elevation = None
+    ascent = 0.0
+    previous = None
+    for lat, lon, ele, epoch in zip(latitudes, longitudes, elevations, epochs):
+        if ele == ele:
+            # not NaN
+            if min_elevation is None or ele < min_elevation:
+                min_elevation = ele
+            if max_elevation is None or ele > max_elevation:
+                max_elevation = ele
+        phi = math.radians(lat)
+        lam = math.radians(lon)
+        if previous is not None:
+            previous_phi, previous_lam, previous_ele, previous_epoch = previous
+            # haversine distance
+            h = (math.sin((phi - previous_phi) / 2) ** 2 +
+                 math.cos(previous_phi) * math.cos(phi) * math.sin((lam - previous_lam) / 2) ** 2)
+            step = 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(h)))
+            distance += step
+            seconds = epoch - previous_epoch
+            if seconds > 0:
+                speed = step / seconds
+                if speed >= MOVING_SPEED_MPS:
+                    moving_time += seconds
+                    moving_distance += step
+                if max_speed is None or speed > max_speed:
+                    max_speed = speed
+            if ele > previous_ele:
+                ascent += ele - previous_ele
+        if ele == ele or previous is None:
+            previous = (phi, lam, ele, epoch)
+        else:
+            previous = (phi, lam, previous[2], epoch)
+    return {
+        'distance_m': distance,
+        'moving_time_s': moving_time,
+        'max_speed_mps': max_speed,
+        'avg_speed_mps': moving_distance / moving_time if moving_time > 0 else None,
+        'min_elevation': min_elevation,
+        'max_elevation': max_elevation,
+        'ascent_m': ascent,
+    }
+
+
+def summarize_track(latitudes, longitudes, elevations, times, segments) -> TrackSummary:
+    """
+    Calculate everything stored about a track besides its points: the point epochs, the time range and statistics
+    of the track and of each of its segments. This is run where the track is parsed, e.g. in the import worker
+    processes, so that the process writing the DB only inserts rows.
+    :param latitudes: latitudes of the points
+    :param longitudes: longitudes of the points
+    :param elevations: elevations of the points, NaN when missing
+    :param times: point times as stored to the DB, None when missing
+    :param segments: segment numbers of the points
+    :return: the summary of the track
+    """
+    epochs = array('d', (time_to_epoch(t) for t in times))
+    segment_summaries = []
+    first = 0
+    for segment, points in groupby(segments):
+        last = first + len(list(points))
+        segment_times = [t for t in times[first:last] if t is not None]
+        stats = compute_track_stats(latitudes[first:last], longitudes[first:last], elevations[first:last],
+                                    epochs[first:last])
+        segment_summaries.append(SegmentSummary(segment, first, last - first, min(segment_times, default=None),
+                                                max(segment_times, default=None), stats))
+        first = last
+    return TrackSummary(min((s.start_time for s in segment_summaries if s.start_time is not None), default=None),
+                        max((s.end_time for s in segment_summaries if s.end_time is not None), default=None),
+                        epochs, compute_track_stats(latitudes, longitudes, elevations, epochs), segment_summaries)